@@ -0,0 +1,89 @@
+"""Measurement of the memory retained by the WSGI environ of each connection.
+
+A number of clients with a realistic set of request headers are connected,
+once with the complete environ retained and once with an empty
+``retain_environ`` list. Each client sends one event, so that the objects
+that handlers leave in the environ, such as the user session, are included.
+The size of the environ dictionaries held by the server is then reported as
+average bytes per connection. Objects that are shared by all connections,
+such as the Flask application, are not counted.
+
+Usage::
+
+    python benchmarks/environ_memory.py [connections]
+"""
+import sys
+
+from flask import Flask
+
+from flask_socketio import SocketIO
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 '
+                  'Firefox/128.0',
+    'Accept': '*/*',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate, br, zstd',
+    'Origin': 'http://localhost:5000',
+    'Referer': 'http://localhost:5000/',
+    'Cookie': 'session=' + 'x' * 120,
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-origin',
+    'Cache-Control': 'no-cache',
+    'Pragma': 'no-cache',
+}
+
+
+def sizeof(obj, shared, seen):
+    if id(obj) in seen or id(obj) in shared:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        # dict.items does not load a lazy session, which would add keys to
+        # the environ while it is walked
+        size += sum(sizeof(k, shared, seen) + sizeof(v, shared, seen)
+                    for k, v in list(dict.items(obj)))
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(sizeof(item, shared, seen) for item in obj)
+    elif hasattr(obj, '__dict__') and \
+            type(obj).__module__.startswith(('flask.', 'werkzeug.')):
+        # requests and other objects stored in the environ by Flask
+        size += sizeof(vars(obj), shared, seen)
+    return size
+
+
+def measure(connections, **kwargs):
+    app = Flask(__name__)
+    socketio = SocketIO(app, **kwargs)
+
+    @socketio.on('connect')
+    def connect():
+        pass
+
+    @socketio.on('event')
+    def event():
+        pass
+
+    clients = [socketio.test_client(app, headers=HEADERS)
+               for _ in range(connections)]
+    for client in clients:
+        client.emit('event')
+    shared = {id(app), id(app.url_map), id(sys.stderr)}
+    seen = set()
+    total = sum(sizeof(socketio.server.environ[client.eio_sid], shared, seen)
+                for client in clients)
+    return total / connections
+
+
+def main(connections):
+    full = measure(connections)
+    trimmed = measure(connections, retain_environ=[])
+    print(f'{"complete environ":<24}{full:>10.0f} bytes/connection')
+    print(f'{"retain_environ=[]":<24}{trimmed:>10.0f} bytes/connection')
+    print(f'{"reduction":<24}{(1 - trimmed / full) * 100:>10.1f} %')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,95 @@
+"""Micro-benchmark of the WSGI middleware that routes requests between the
+Flask application and the Socket.IO server.
+
+A mix of regular HTTP requests and Socket.IO long-polling requests is sent
+through the middleware, once with the previous behavior of copying the WSGI
+environ for every request and once with the current one. The Flask and
+Socket.IO applications are replaced with stubs, so that only the cost of
+the middleware is measured.
+
+Usage::
+
+    python benchmarks/middleware.py [iterations] [http_ratio]
+"""
+import sys
+import timeit
+
+from flask import Flask
+
+from flask_socketio import SocketIO, _SocketIOMiddleware
+
+
+class LegacyMiddleware(_SocketIOMiddleware):
+    def __call__(self, environ, start_response):
+        environ = environ.copy()
+        environ['flask.app'] = self.flask_app
+        return super(_SocketIOMiddleware, self).__call__(
+            environ, start_response)
+
+
+def make_environ(path, query_string=''):
+    # a typical environ, as produced by a production WSGI server
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query_string,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '5000',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'REMOTE_PORT': '54321',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': None,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for i in range(20):
+        environ[f'HTTP_X_HEADER_{i}'] = 'x' * 32
+    return environ
+
+
+def stub_app(environ, start_response):
+    return []
+
+
+def start_response(status, headers):
+    pass
+
+
+def run(middleware, environs, iterations):
+    def requests():
+        for environ in environs:
+            middleware(environ, start_response)
+
+    return timeit.timeit(requests, number=iterations) / (
+        iterations * len(environs))
+
+
+def main(iterations, http_ratio):
+    app = Flask(__name__)
+    socketio = SocketIO(app)
+    socketio.server.handle_request = stub_app
+
+    http = round(http_ratio * 10)
+    environs = [make_environ('/index') for _ in range(http)] + [
+        make_environ('/socket.io/', 'EIO=4&transport=polling&sid=abc')
+        for _ in range(10 - http)]
+
+    results = {}
+    for name, cls in [('environ copy', LegacyMiddleware),
+                      ('fast path', _SocketIOMiddleware)]:
+        middleware = cls(socketio.server, app)
+        middleware.wsgi_app = stub_app
+        results[name] = run(middleware, environs, iterations)
+        print(f'{name:<24}{results[name] * 1e9:>10.1f} ns/request')
+    print(f'{"speedup":<24}'
+          f'{results["environ copy"] / results["fast path"]:>10.1f} x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 0.8)
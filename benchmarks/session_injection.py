@@ -0,0 +1,52 @@
+"""Micro-benchmark of the managed session injection done for each event.
+
+Compares the Flask version probing that used to run on every event against
+the session injector that Flask-SocketIO now selects when it is initialized.
+
+Usage::
+
+    python benchmarks/session_injection.py [iterations]
+"""
+import sys
+import timeit
+
+import flask
+from flask import Flask
+
+from flask_socketio import SocketIO, _ManagedSession
+
+
+def legacy_inject(session_obj):
+    if hasattr(flask, 'globals') and hasattr(flask.globals, 'app_ctx'):
+        if hasattr(flask.globals.app_ctx, 'session'):
+            ctx = flask.globals.app_ctx._get_current_object()
+        else:
+            ctx = flask.globals.request_ctx._get_current_object()
+    else:
+        ctx = flask._request_ctx_stack.top
+    if hasattr(ctx, '_session'):
+        ctx._session = session_obj
+    else:
+        ctx.session = session_obj
+
+
+def main(iterations):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'secret'
+    socketio = SocketIO(app)
+    injector = socketio.session_injector
+    session_obj = _ManagedSession()
+
+    with app.test_request_context() as ctx:
+        before = timeit.timeit(lambda: legacy_inject(session_obj),
+                               number=iterations)
+        after = timeit.timeit(lambda: injector.inject(ctx, session_obj),
+                              number=iterations)
+
+    print(f'{"per-event probing":<24}{before / iterations * 1e9:>10.1f} ns')
+    print(f'{type(injector).__name__:<24}{after / iterations * 1e9:>10.1f} ns')
+    print(f'{"speedup":<24}{before / after:>10.1f} x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,255 @@
+"""Benchmark suite for the event dispatch and emit hot paths.
+
+The benchmarks run in a single process, without network access, using the
+Socket.IO test client and direct calls into the server. Results are printed
+and can be saved as a JSON baseline, to be compared against later runs.
+
+Usage::
+
+    python benchmarks/suite.py run [--quick] [--filter NAME] [--output FILE]
+    python benchmarks/suite.py compare BASELINE CURRENT [--threshold PERCENT]
+
+The ``compare`` command exits with status 1 when any benchmark regressed by
+more than the threshold percentage, which defaults to 10.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from flask import Flask, session
+import socketio as python_socketio
+
+import flask_socketio
+from flask_socketio import SocketIO, emit, join_room
+
+PAYLOAD = {
+    'id': 12345,
+    'user': {'name': 'susan', 'roles': ['admin', 'editor'], 'active': True},
+    'message': 'The quick brown fox jumps over the lazy dog. ' * 4,
+    'values': [1.5, 2.25, 3.125, 4.0625] * 8,
+    'tags': {f'tag{i}': i for i in range(16)},
+}
+
+
+def measure(func, iterations):
+    """Call ``func`` the given number of times and return its statistics."""
+    samples = []
+    perf_counter_ns = time.perf_counter_ns
+    start = perf_counter_ns()
+    for _ in range(iterations):
+        t = perf_counter_ns()
+        func()
+        samples.append(perf_counter_ns() - t)
+    total = perf_counter_ns() - start
+    samples.sort()
+    return {
+        'ops_per_sec': iterations * 1e9 / total,
+        'p50_us': samples[len(samples) // 2] / 1000,
+        'p99_us': samples[min(len(samples) - 1,
+                              int(len(samples) * 0.99))] / 1000,
+    }
+
+
+def make_server(**kwargs):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'secret'
+    socketio = SocketIO(app, **kwargs)
+
+    @socketio.on('echo')
+    def on_echo(data):
+        emit('echo', data)
+
+    @socketio.on('join')
+    def on_join(room):
+        join_room(room)
+
+    return app, socketio
+
+
+def get_sid(socketio, client, namespace='/'):
+    return socketio.server.manager.sid_from_eio_sid(client.eio_sid,
+                                                    namespace)
+
+
+def bench_test_client_roundtrip(iterations):
+    app, socketio = make_server()
+    client = socketio.test_client(app)
+
+    def run():
+        client.emit('echo', PAYLOAD)
+        client.get_received()
+
+    return measure(run, iterations)
+
+
+def bench_handle_event(iterations):
+    app, socketio = make_server()
+    client = socketio.test_client(app)
+    sid = get_sid(socketio, client)
+
+    def handler(data):
+        pass
+
+    return measure(lambda: socketio._handle_event(handler, 'noop', '/', sid,
+                                                  PAYLOAD), iterations)
+
+
+def bench_handle_event_light_context(iterations):
+    app, socketio = make_server(light_context=True)
+    client = socketio.test_client(app)
+    sid = get_sid(socketio, client)
+
+    def handler(data):
+        pass
+
+    return measure(lambda: socketio._handle_event(handler, 'noop', '/', sid,
+                                                  PAYLOAD), iterations)
+
+
+def _session_benchmark(iterations, manage_session):
+    app, socketio = make_server(manage_session=manage_session)
+    client = socketio.test_client(app)
+    sid = get_sid(socketio, client)
+
+    def handler(data):
+        session['count'] = session.get('count', 0) + 1
+
+    return measure(lambda: socketio._handle_event(handler, 'session', '/',
+                                                  sid, None), iterations)
+
+
+def bench_session_managed(iterations):
+    return _session_benchmark(iterations, True)
+
+
+def bench_session_unmanaged(iterations):
+    return _session_benchmark(iterations, False)
+
+
+def _fanout_benchmark(room_size):
+    def bench(iterations):
+        app, socketio = make_server()
+        clients = [socketio.test_client(app) for _ in range(room_size)]
+        for client in clients:
+            client.emit('join', 'room')
+
+        def run():
+            socketio.emit('message', PAYLOAD, to='room')
+
+        stats = measure(run, max(10, iterations // room_size))
+        for client in clients:
+            client.disconnect()
+        return stats
+
+    return bench
+
+
+def _json_benchmark(codec):
+    def bench(iterations):
+        app = Flask(__name__)
+        json = flask_socketio._get_json_codec(codec, app)
+        saved_json = python_socketio.packet.Packet.json
+        python_socketio.packet.Packet.json = json
+        try:
+            pkt = python_socketio.packet.Packet(
+                python_socketio.packet.EVENT, data=['message', PAYLOAD])
+            encoded = pkt.encode()
+
+            def run():
+                python_socketio.packet.Packet(encoded_packet=encoded)
+                pkt.encode()
+
+            return measure(run, iterations)
+        finally:
+            python_socketio.packet.Packet.json = saved_json
+
+    return bench
+
+
+def get_benchmarks():
+    benchmarks = {
+        'test_client_roundtrip': bench_test_client_roundtrip,
+        'handle_event': bench_handle_event,
+        'handle_event_light_context': bench_handle_event_light_context,
+        'session_managed': bench_session_managed,
+        'session_unmanaged': bench_session_unmanaged,
+    }
+    for room_size in (1, 10, 100, 1000):
+        benchmarks[f'emit_fanout_{room_size}'] = _fanout_benchmark(room_size)
+    benchmarks['json_stdlib'] = _json_benchmark(json)
+    benchmarks['json_flask'] = _json_benchmark('flask')
+    try:
+        import orjson  # noqa: F401
+    except ImportError:  # pragma: no cover
+        pass
+    else:
+        benchmarks['json_orjson'] = _json_benchmark('orjson')
+    return benchmarks
+
+
+def run(args):
+    iterations = 2000 if args.quick else 20000
+    results = {}
+    for name, bench in get_benchmarks().items():
+        if args.filter and args.filter not in name:
+            continue
+        bench(max(10, iterations // 10))  # warm up
+        results[name] = stats = bench(iterations)
+        print(f'{name:<32}{stats["ops_per_sec"]:>12.0f} ops/s'
+              f'{stats["p50_us"]:>10.1f} us p50'
+              f'{stats["p99_us"]:>10.1f} us p99')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    with open(args.current) as f:
+        current = json.load(f)['results']
+    regressions = 0
+    for name in sorted(set(baseline) & set(current)):
+        # throughput going down is a regression
+        change = (current[name]['ops_per_sec']
+                  / baseline[name]['ops_per_sec'] - 1) * 100
+        regressed = change < -args.threshold
+        regressions += regressed
+        print(f'{name:<32}{baseline[name]["ops_per_sec"]:>12.0f}'
+              f'{current[name]["ops_per_sec"]:>12.0f} ops/s'
+              f'{change:>+9.1f}%{"  REGRESSION" if regressed else ""}')
+    for name in sorted(set(baseline) ^ set(current)):
+        source = 'baseline' if name in baseline else 'current'
+        print(f'{name:<32}only in {source}')
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--quick', action='store_true',
+                            help='run fewer iterations')
+    run_parser.add_argument('--filter',
+                            help='only run benchmarks with this substring')
+    run_parser.add_argument('--output', help='save the results to this file')
+    compare_parser = subparsers.add_parser(
+        'compare', help='compare two saved results')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=10.0,
+                                help='regression threshold in percent')
+    args = parser.parse_args(argv)
+    return run(args) if args.command == 'run' else compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
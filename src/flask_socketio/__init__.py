@@ -1,6 +1,16 @@
-from functools import wraps
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial, wraps
+import inspect
+import io
 import os
+import shutil
+import socket
 import sys
+import tempfile
+import threading
+import time
+import uuid
 
 # make sure gevent-socketio is not installed, as it conflicts with
 # python-socketio
@@ -15,17 +25,35 @@ if gevent_socketio_found:
           'install the latest version of python-socketio in its place.')
     sys.exit(1)
 
+import blinker
 import flask
 from flask import has_request_context, json as flask_json
 from flask.sessions import SessionMixin
 import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
 from socketio.exceptions import ConnectionRefusedError  # noqa: F401
 from werkzeug.debug import DebuggedApplication
 from werkzeug._reloader import run_with_reloader
 
+from .asgi import _AsyncServerBridge
+from .dispatch import compile_handler
+from .executor import HandlerExecutor
+from .metrics import Metrics
+from .monitor import LagMonitor
 from .namespace import Namespace
+from .profiler import Profiler
+from .preserialized import Preserialized, PreserializedCache, \
+    PreserializedPacket, unwrap  # noqa: F401
+from .pubsub import PubSubMixin, pubsub_class, CODECS
 from .test_client import SocketIOTestClient
 
+_signals = blinker.Namespace()
+
+#: Signal sent when an event handler exceeds its time budget. The sender is
+#: the :class:`SocketIO` instance, and the ``namespace``, ``event``, ``sid``,
+#: ``elapsed`` and ``time_budget`` arguments describe the slow event.
+slow_event = _signals.signal('slow-event')
+
 
 class _SocketIOMiddleware(socketio.WSGIApp):
     """This WSGI middleware simply exposes the Flask application in the WSGI
@@ -37,16 +65,309 @@ class _SocketIOMiddleware(socketio.WSGIApp):
                          socketio_path=socketio_path)
 
     def __call__(self, environ, start_response):
-        environ = environ.copy()
+        path = environ.get('PATH_INFO')
+        if path is None or not path.startswith(self.engineio_path):
+            # regular Flask routes do not need the Socket.IO additions
+            return self.wsgi_app(environ, start_response)
+        query_string = environ.get('QUERY_STRING', '')
+        if '&sid=' not in query_string and \
+                not query_string.startswith('sid='):
+            # the environ of a connection request is retained by the server
+            # for the lifetime of the connection, so it gets its own copy
+            environ = environ.copy()
         environ['flask.app'] = self.flask_app
         return super().__call__(environ, start_response)
 
 
+# WSGI environ keys that are needed to rebuild the request context of a
+# client after it connects
+_ESSENTIAL_ENVIRON_KEYS = frozenset([
+    'REQUEST_METHOD', 'SCRIPT_NAME', 'PATH_INFO', 'QUERY_STRING',
+    'SERVER_NAME', 'SERVER_PORT', 'SERVER_PROTOCOL', 'REMOTE_ADDR',
+    'HTTP_HOST', 'HTTP_COOKIE', 'wsgi.url_scheme', 'flask.app',
+    'saved_session', 'flask_socketio.contexts'])
+
+
+def _trim_environ(environ, retain_keys):
+    """Remove the keys that are not needed anymore from the environ of a
+    connected client. The input stream of the connection request is replaced
+    with an empty stream, so that it can be released."""
+    for key in [key for key in environ if key not in retain_keys]:
+        del environ[key]
+    environ['wsgi.input'] = io.BytesIO()
+
+
+class _SocketIOServer(socketio.Server):
+    """The Socket.IO server used by Flask-SocketIO."""
+    retain_environ = None
+    executor = None
+
+    def _handle_event(self, eio_sid, namespace, id, data):
+        if self.executor is None or not self.async_handlers:
+            return super()._handle_event(eio_sid, namespace, id, data)
+        namespace = namespace or '/'
+        sid = self.manager.sid_from_eio_sid(eio_sid, namespace)
+        self.logger.info('received event "%s" from %s [%s]', data[0], sid,
+                         namespace)
+        if not self.manager.is_connected(sid, namespace):
+            self.logger.warning('%s is not connected to namespace %s',
+                                sid, namespace)
+            return
+        self.executor.submit(self._handle_event_internal, self, sid, eio_sid,
+                             data, namespace, id, key=sid)
+
+    def _handle_connect(self, eio_sid, namespace, data):
+        try:
+            super()._handle_connect(eio_sid, namespace, data)
+        finally:
+            if self.retain_environ is not None and eio_sid in self.environ:
+                _trim_environ(self.environ[eio_sid], self.retain_environ)
+
+    def _trigger_event(self, event, namespace, *args):
+        # the connect and disconnect handlers are compiled to accept the
+        # arguments of all the supported signatures, so they are invoked once,
+        # without the retries python-socketio makes after a TypeError
+        if event == 'connect' and len(args) < 3:
+            # the retry without the auth argument, which makes python-socketio
+            # raise the error of the first call
+            raise TypeError('connect handler already invoked')
+        if event != 'disconnect':
+            return super()._trigger_event(event, namespace, *args)
+        handler, args = self._get_event_handler(event, namespace, args)
+        if handler:
+            return handler(*args)
+        handler, args = self._get_namespace_handler(namespace, args)
+        if handler:
+            return handler.trigger_event(event, *args)
+        return self.not_handled
+
+
 class _ManagedSession(dict, SessionMixin):
     """This class is used for user sessions that are managed by
-    Flask-SocketIO. It is simple dict, expanded with the Flask session
-    attributes."""
-    pass
+    Flask-SocketIO. It is a dictionary, expanded with the Flask session
+    attributes.
+
+    When a ``loader`` function is given, the session is not loaded until it
+    is first accessed, either through the ``session`` proxy, which sets the
+    ``accessed`` attribute, or through any of the dictionary methods.
+    """
+    def __init__(self, data=(), loader=None):
+        super().__init__(data)
+        self._loader = loader
+
+    @property
+    def loaded(self):
+        return self._loader is None
+
+    def load(self):
+        """Load the contents of the session, if they are not loaded yet."""
+        loader = self._loader
+        if loader is not None:
+            data = loader() or {}
+            if self._loader is not None:
+                dict.update(self, data)
+                self._loader = None
+
+    @property
+    def accessed(self):
+        return True
+
+    @accessed.setter
+    def accessed(self, value):
+        # Flask sets this attribute each time the session proxy is used
+        if value:
+            self.load()
+
+
+def _load_first(name):
+    method = getattr(dict, name)
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.load()
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+for _name in ['__getitem__', '__setitem__', '__delitem__', '__iter__',
+              '__len__', '__contains__', '__eq__', '__ne__', '__repr__',
+              '__reversed__', '__or__', '__ior__', 'get', 'keys', 'values',
+              'items', 'pop', 'popitem', 'setdefault', 'update', 'clear',
+              'copy']:
+    if hasattr(dict, _name):  # the | operators require Python 3.9
+        setattr(_ManagedSession, _name, _load_first(_name))
+
+
+class _TrackedSession(SessionMixin):
+    """This class wraps the Flask user session when the session is not
+    managed by Flask-SocketIO, to record the keys that are changed by an event
+    handler. Other attributes are those of the wrapped session."""
+    def __init__(self, session):
+        self.session = session
+        self.dirty_keys = set()
+        self._modified = False
+
+    @property
+    def modified(self):
+        return self._modified or bool(self.dirty_keys)
+
+    @modified.setter
+    def modified(self, value):
+        # handlers set this attribute after changing mutable values in place
+        self._modified = value
+        if hasattr(self.session, 'modified'):
+            self.session.modified = value
+
+    @property
+    def new(self):
+        return getattr(self.session, 'new', False)
+
+    @property
+    def __class__(self):
+        # isinstance() checks see the class of the wrapped session
+        return type(self.session)
+
+    def __getattr__(self, name):
+        # attributes of the session backend, such as a session id
+        if name == 'session':
+            raise AttributeError(name)
+        return getattr(self.session, name)
+
+    def __getitem__(self, key):
+        return self.session[key]
+
+    def __setitem__(self, key, value):
+        self.session[key] = value
+        self.dirty_keys.add(key)
+
+    def __delitem__(self, key):
+        del self.session[key]
+        self.dirty_keys.add(key)
+
+    def __iter__(self):
+        return iter(self.session)
+
+    def __len__(self):
+        return len(self.session)
+
+    def __contains__(self, key):
+        return key in self.session
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.session!r}>'
+
+
+def _open_user_session(app, environ):
+    """Open the Flask user session of a client."""
+    if has_request_context():
+        request = flask.request._get_current_object()
+    else:
+        # the request is not stored in the environ of the client
+        request = app.request_class(environ, populate_request=False)
+    return app.session_interface.open_session(app, request)
+
+
+class _SessionInjector:
+    """This class installs the user session in a request context, for Flask
+    releases that store the session in the ``session`` attribute of the
+    context (Flask < 3.1.3)."""
+    def inject(self, ctx, session):
+        if isinstance(session, _ManagedSession):
+            # these releases do not report accesses through the session
+            # proxy, so the session cannot be loaded on first access
+            session.load()
+        ctx.session = session
+
+
+class _PrivateSessionInjector(_SessionInjector):
+    """Session injector for Flask releases that expose the session as a
+    property backed by the ``_session`` attribute (Flask >= 3.1.3)."""
+    def inject(self, ctx, session):
+        ctx._session = session
+
+
+def _get_session_injector():
+    """Return the session injector that is compatible with the installed
+    version of Flask."""
+    if hasattr(flask.ctx.AppContext, 'session'):
+        # the session is stored in the app context for flask >= 3.2
+        ctx_class = flask.ctx.AppContext
+    else:
+        ctx_class = flask.ctx.RequestContext
+    if isinstance(getattr(ctx_class, 'session', None), property):
+        return _PrivateSessionInjector()
+    return _SessionInjector()
+
+
+class _ORJSONCodec:
+    """JSON codec that uses the orjson package. Dictionary keys that are not
+    strings are converted to strings, as the standard library does."""
+    def __init__(self):
+        try:
+            import orjson
+        except ImportError:
+            raise RuntimeError('orjson package is not installed (Run "pip '
+                               'install orjson" in your virtualenv).')
+        self._dumps = orjson.dumps
+        self._loads = orjson.loads
+        self._options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return self._dumps(obj, option=self._options).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return self._loads(s)
+
+
+def _wrap_eventlet_ssl(sock, kwargs):  # pragma: no cover
+    """Wrap an eventlet listening socket with SSL when SSL arguments are
+    given, removing them from the web server options."""
+    import eventlet
+    ssl_args = ['keyfile', 'certfile', 'server_side', 'cert_reqs',
+                'ssl_version', 'ca_certs', 'do_handshake_on_connect',
+                'suppress_ragged_eofs', 'ciphers']
+    ssl_params = {k: kwargs[k] for k in kwargs
+                  if k in ssl_args and kwargs[k] is not None}
+    for k in ssl_args:
+        kwargs.pop(k, None)
+    if len(ssl_params) > 0:
+        ssl_params['server_side'] = True  # Listening requires true
+        sock = eventlet.wrap_ssl(sock, **ssl_params)
+    return sock
+
+
+def _get_json_codec(json, app):
+    """Return the JSON codec to use for the given ``json`` option."""
+    if json == 'orjson':
+        return _ORJSONCodec()
+    elif json == 'flask' or json == flask_json:
+        if app is None:
+            return flask_json
+        if hasattr(app, 'json'):
+            # use the application's JSON provider (Flask >= 2.2), which does
+            # not depend on the application context
+            return app.json
+
+        # flask's json module is tricky to use because its output
+        # changes when it is invoked inside or outside the app context
+        # so here to prevent any ambiguities we replace it with wrappers
+        # that ensure that the app context is always present
+        class FlaskSafeJSON:  # pragma: no cover
+            @staticmethod
+            def dumps(*args, **kwargs):
+                with app.app_context():
+                    return flask_json.dumps(*args, **kwargs)
+
+            @staticmethod
+            def loads(*args, **kwargs):
+                with app.app_context():
+                    return flask_json.loads(*args, **kwargs)
+
+        return FlaskSafeJSON
+    elif isinstance(json, str):
+        raise ValueError(f'Unsupported JSON codec: {json}')
+    return json
 
 
 class SocketIO:
@@ -64,15 +385,110 @@ class SocketIO:
                            using server-side sessions, a ``False`` setting
                            enables sharing the user session between HTTP routes
                            and Socket.IO events.
+    :param light_context: If set to ``True``, the Flask request context that
+                          is built for the first event of a client is reused
+                          for all subsequent events from that client on the
+                          same namespace, instead of building a new one for
+                          each event. This reduces the per-event dispatch
+                          overhead, at the cost of keeping a request object
+                          in memory for each connected client. The default
+                          is ``False``.
+    :param retain_environ: A list of WSGI environ keys to keep for each
+                           client after its connect handler runs, in addition
+                           to the keys that are needed to build request
+                           contexts for its events. HTTP headers are given
+                           with their environ names, such as
+                           ``'HTTP_USER_AGENT'``. All other keys, including
+                           the input stream and server objects, are
+                           discarded to reduce the memory used by each
+                           connection. Note that connect handlers for
+                           additional namespaces also see the reduced
+                           environ. The default of ``None`` keeps the
+                           complete environ.
+    :param metrics: If set to ``True``, metrics about the events handled and
+                    emitted by the server are collected, and made available
+                    in the ``metrics`` attribute as a :class:`Metrics`
+                    instance. A :class:`Metrics` instance can also be given.
+                    The default is ``False``, which does not collect any
+                    metrics.
+    :param profiler: The fraction of events to profile with :mod:`cProfile`,
+                     as a number between 0 and 1. The profiling results are
+                     aggregated for each event, and are available in the
+                     ``profiler`` attribute as a :class:`Profiler` instance.
+                     A :class:`Profiler` instance can also be given. The
+                     default is ``None``, which does not profile any events.
+    :param lag_monitor: If set to ``True``, a background task measures the
+                        scheduling lag of the event loop, to detect code that
+                        blocks it. A :class:`LagMonitor` instance with custom
+                        settings can also be given. The monitor is available
+                        in the ``lag_monitor`` attribute. This option is
+                        intended for the eventlet and gevent async modes. The
+                        default is ``False``.
+    :param executor: A dictionary with the configuration of a pool of worker
+                     threads that handle events, with ``max_workers``,
+                     ``queue_size``, ``rejection_policy`` and ``ordered``
+                     keys. See :class:`HandlerExecutor` for details. A
+                     :class:`HandlerExecutor` instance can also be given.
+                     This option is only supported in the ``threading``
+                     async mode. The default is ``None``, which handles each
+                     event in a new thread.
+    :param process_pool: The number of worker processes used to run handlers
+                         registered with ``executor='process'``, or a
+                         ``concurrent.futures`` executor instance to use for
+                         them. The default is ``None``, which creates a
+                         ``ProcessPoolExecutor`` with one process per CPU the
+                         first time it is needed.
+    :param time_budget: The default time budget for event handlers, in
+                        seconds. When a handler takes longer than its time
+                        budget, a warning is logged and the
+                        :data:`slow_event` signal is sent. Time budgets for
+                        individual handlers can be given in the ``on()``
+                        decorator. The default is ``None``, which does not
+                        check handler durations.
     :param message_queue: A connection URL for a message queue service the
                           server can use for multi-process communication. A
                           message queue is not required when using a single
-                          server process.
+                          server process. For servers that run on the same
+                          host, a ``unix://`` URL followed by the path of a
+                          Unix socket selects a local message queue that
+                          does not need a broker.
     :param channel: The channel name, when using a message queue. If a channel
                     isn't specified, a default channel will be used. If
                     multiple clusters of SocketIO processes need to use the
                     same message queue without interfering with each other,
                     then each cluster should use a different channel.
+    :param batch_window: When using a message queue, the maximum time in
+                         seconds that an emit can be delayed to be published
+                         together with other emits as a single queue
+                         message. This is useful for processes that emit
+                         many small events, such as a worker that only
+                         emits through the queue. The default is ``None``,
+                         which publishes each emit on its own. Call
+                         :meth:`flush` to publish the pending emits
+                         immediately.
+    :param batch_size: The maximum number of emits that are published
+                       together when ``batch_window`` is set. The default is
+                       100.
+    :param queue_routing: When using a message queue, set to ``True`` to
+                          send the emits addressed to rooms or clients only
+                          to the servers that have members in them, instead
+                          of to all the servers. The servers exchange the
+                          lists of rooms they host through the queue. This
+                          option must be set in all the servers that share
+                          the queue. The default is ``False``.
+    :param queue_compression: When using a message queue, the codec used to
+                              compress large messages before they are
+                              published, ``'zlib'`` or ``'lz4'``. The lz4
+                              codec requires the ``lz4`` package. The servers
+                              that listen on the queue decompress these
+                              messages regardless of this option. The default
+                              is ``None``, which disables compression.
+    :param queue_compression_threshold: The minimum size in bytes of an
+                                        encoded message to compress it when
+                                        ``queue_compression`` is set. The
+                                        default is 1024.
+    :param preserialize_cache_size: The maximum number of arguments kept by
+                                    :meth:`preserialize`. The default is 128.
     :param path: The path where the Socket.IO server is exposed. Defaults to
                  ``'socket.io'``. Leave this as is unless you know what you are
                  doing.
@@ -99,8 +515,12 @@ class SocketIO:
     :param json: An alternative JSON module to use for encoding and decoding
                  packets. Custom json modules must have ``dumps`` and ``loads``
                  functions that are compatible with the standard library
-                 versions. This is a process-wide setting, all instantiated
-                 servers and clients must use the same JSON module.
+                 versions. Pass ``'orjson'`` to use the orjson package, or
+                 ``'flask'`` (or the ``flask.json`` module) to use the JSON
+                 provider of the Flask application, so that its custom type
+                 serialization rules apply to Socket.IO packets. This is a
+                 process-wide setting, all instantiated servers and clients
+                 must use the same JSON module.
     :param async_handlers: If set to ``True``, event handlers for a client are
                            executed in separate threads. To run handlers for a
                            client synchronously, set to ``False``. The default
@@ -126,11 +546,14 @@ class SocketIO:
     :param async_mode: The asynchronous model to use. See the Deployment
                        section in the documentation for a description of the
                        available options. Valid async modes are "threading",
-                       "eventlet", "gevent" and "gevent_uwsgi". If this
-                       argument is not given, "eventlet" is tried first, then
-                       "gevent_uwsgi", then "gevent", and finally "threading".
-                       The first async mode that has all its dependencies
-                       installed is the one that is chosen.
+                       "eventlet", "gevent", "gevent_uwsgi" and "asgi". If
+                       this argument is not given, "eventlet" is tried first,
+                       then "gevent_uwsgi", then "gevent", and finally
+                       "threading". The first async mode that has all its
+                       dependencies installed is the one that is chosen. The
+                       "asgi" mode is never chosen automatically. In this
+                       mode the ASGI application is available as
+                       ``socketio.asgi_app``.
     :param ping_interval: The interval in seconds at which the server pings
                           the client. The default is 25 seconds. For advanced
                           control, a two element tuple can be given, where
@@ -186,11 +609,25 @@ class SocketIO:
         self.server = None
         self.server_options = {}
         self.wsgi_server = None
+        self.asgi_app = None
         self.handlers = []
         self.namespace_handlers = []
         self.exception_handlers = {}
         self.default_exception_handler = None
         self.manage_session = True
+        self.light_context = False
+        self.retain_environ = None
+        self.metrics = None
+        self.profiler = None
+        self.time_budget = None
+        self.lag_monitor = None
+        self.process_pool = None
+        self.process_pool_workers = None
+        self.process_pool_lock = threading.Lock()
+        self.session_injector = None
+        self.preserialize_cache = PreserializedCache()
+        self.queue_factory = None
+        self.encode_once = False
         # We can call init_app when:
         # - we were given the Flask app instance (standard initialization)
         # - we were not given the app, but we were given a message_queue
@@ -210,42 +647,111 @@ class SocketIO:
         self.server_options.update(kwargs)
         self.manage_session = self.server_options.pop('manage_session',
                                                       self.manage_session)
+        self.light_context = self.server_options.pop('light_context',
+                                                     self.light_context)
+        self.retain_environ = self.server_options.pop('retain_environ',
+                                                      self.retain_environ)
+        metrics = self.server_options.pop('metrics', None)
+        if metrics is True:
+            self.metrics = Metrics()
+        elif metrics:
+            self.metrics = metrics
+        self.time_budget = self.server_options.pop('time_budget',
+                                                   self.time_budget)
+        executor = self.server_options.pop('executor', None)
+        process_pool = self.server_options.pop('process_pool', None)
+        if isinstance(process_pool, int):
+            self.process_pool_workers = process_pool
+        elif process_pool is not None:
+            self.process_pool = process_pool
+        lag_monitor = self.server_options.pop('lag_monitor', None)
+        if lag_monitor is True:
+            self.lag_monitor = LagMonitor()
+        elif lag_monitor:
+            self.lag_monitor = lag_monitor
+        profiler = self.server_options.pop('profiler', None)
+        if isinstance(profiler, Profiler):
+            self.profiler = profiler
+        elif profiler is not None:
+            self.profiler = Profiler(sample_rate=profiler)
+        self.session_injector = _get_session_injector()
+        batch_window = self.server_options.pop('batch_window', None)
+        batch_size = self.server_options.pop('batch_size', 100)
+        queue_routing = self.server_options.pop('queue_routing', False)
+        queue_compression = self.server_options.pop('queue_compression', None)
+        queue_compression_threshold = self.server_options.pop(
+            'queue_compression_threshold', 1024)
+        self.preserialize_cache.maxsize = self.server_options.pop(
+            'preserialize_cache_size', self.preserialize_cache.maxsize)
 
         if 'client_manager' not in kwargs:
             url = self.server_options.get('message_queue', None)
             channel = self.server_options.pop('channel', 'flask-socketio')
             write_only = app is None
+            asgi = self.server_options.get('async_mode') == 'asgi'
             if url:
-                if url.startswith(('redis://', "rediss://")):
+                if asgi:
+                    if url.startswith(('redis://', 'rediss://')):
+                        queue_class = socketio.AsyncRedisManager
+                    elif url.startswith(('amqp://', 'amqps://')):
+                        queue_class = socketio.AsyncAioPikaManager
+                    else:
+                        raise ValueError('Only Redis and AMQP message queues '
+                                         'are supported in the asgi async '
+                                         'mode')
+                elif url.startswith(('redis://', "rediss://")):
                     queue_class = socketio.RedisManager
+                elif url.startswith('unix://'):
+                    from .unix_manager import UnixSocketManager
+                    queue_class = UnixSocketManager
                 elif url.startswith('kafka://'):
                     queue_class = socketio.KafkaManager
                 elif url.startswith('zmq'):
                     queue_class = socketio.ZmqManager
                 else:
                     queue_class = socketio.KombuManager
-                queue = queue_class(url, channel=channel,
-                                    write_only=write_only)
-                self.server_options['client_manager'] = queue
-
-        if 'json' in self.server_options and \
-                self.server_options['json'] == flask_json:
-            # flask's json module is tricky to use because its output
-            # changes when it is invoked inside or outside the app context
-            # so here to prevent any ambiguities we replace it with wrappers
-            # that ensure that the app context is always present
-            class FlaskSafeJSON:
-                @staticmethod
-                def dumps(*args, **kwargs):
-                    with app.app_context():
-                        return flask_json.dumps(*args, **kwargs)
-
-                @staticmethod
-                def loads(*args, **kwargs):
-                    with app.app_context():
-                        return flask_json.loads(*args, **kwargs)
-
-            self.server_options['json'] = FlaskSafeJSON
+                if not asgi:
+                    queue_class = pubsub_class(queue_class)
+
+                def create_queue():
+                    queue = queue_class(url, channel=channel,
+                                        write_only=write_only)
+                    if batch_window is not None:
+                        if asgi:
+                            raise ValueError('Batched publishing is not '
+                                             'supported in the asgi async '
+                                             'mode')
+                        queue.batch_window = batch_window
+                        queue.batch_size = batch_size
+                    if queue_routing:
+                        if asgi:
+                            raise ValueError('Message queue routing is not '
+                                             'supported in the asgi async '
+                                             'mode')
+                        queue.routing = True
+                    if queue_compression is not None:
+                        if asgi:
+                            raise ValueError('Message queue compression is '
+                                             'not supported in the asgi '
+                                             'async mode')
+                        if queue_compression not in CODECS:
+                            raise ValueError('Unsupported compression codec: '
+                                             f'{queue_compression}')
+                        queue.compression = queue_compression
+                        queue.compression_threshold = \
+                            queue_compression_threshold
+                    return queue
+
+                self.server_options['client_manager'] = create_queue()
+                # forked workers create their own message queue clients
+                self.queue_factory = create_queue
+
+        if 'json' in self.server_options:
+            self.server_options['json'] = _get_json_codec(
+                self.server_options['json'], app)
+        if self.server_options.get('serializer', 'default') == 'default':
+            # the default packets, which can insert preserialized arguments
+            self.server_options['serializer'] = PreserializedPacket
 
         resource = self.server_options.pop('path', None) or \
             self.server_options.pop('resource', None) or 'socket.io'
@@ -254,14 +760,45 @@ class SocketIO:
         if os.environ.get('FLASK_RUN_FROM_CLI'):
             if self.server_options.get('async_mode') is None:
                 self.server_options['async_mode'] = 'threading'
-        self.server = socketio.Server(**self.server_options)
+        if self.server_options.get('async_mode') == 'asgi':
+            self.server = _AsyncServerBridge(app, **self.server_options)
+        else:
+            self.server = _SocketIOServer(**self.server_options)
+        if self.retain_environ is not None:
+            self.server.retain_environ = _ESSENTIAL_ENVIRON_KEYS.union(
+                self.retain_environ)
         self.async_mode = self.server.async_mode
+        # preserialized arguments are sent as is when the packets support
+        # them, and the message queue, if any, does not need to encode them
+        manager = self.server.manager
+        self.encode_once = issubclass(
+            self.server.packet_class, PreserializedPacket) and (
+            isinstance(manager, PubSubMixin) or not isinstance(
+                manager, (socketio.PubSubManager, AsyncPubSubManager)))
+        if executor is not None:
+            if self.async_mode != 'threading':
+                raise ValueError('The executor option is only supported in '
+                                 'the threading async mode')
+            if not isinstance(executor, HandlerExecutor):
+                executor = HandlerExecutor(**executor)
+            self.server.executor = executor
+            # the executor runs the handlers, so there is no need to start a
+            # thread for each incoming message
+            self.server.eio.async_handlers = False
+        if self.metrics is not None:
+            self.metrics.init_server(self.server)
+        if self.lag_monitor is not None:
+            self.lag_monitor.start(self)
         for handler in self.handlers:
             self.server.on(handler[0], handler[1], namespace=handler[2])
         for namespace_handler in self.namespace_handlers:
             self.server.register_namespace(namespace_handler)
 
-        if app is not None:
+        if app is not None and self.async_mode == 'asgi':
+            # the Flask application is served by the ASGI application, so
+            # the WSGI application is left unchanged
+            self.asgi_app = self.server.asgi_app(app, socketio_path=resource)
+        elif app is not None:
             # here we attach the SocketIO middleware to the SocketIO object so
             # it can be referenced later if debug middleware needs to be
             # inserted
@@ -269,7 +806,7 @@ class SocketIO:
                                                  socketio_path=resource)
             app.wsgi_app = self.sockio_mw
 
-    def on(self, message, namespace=None):
+    def on(self, message, namespace=None, time_budget=None, executor=None):
         """Decorator to register a SocketIO event handler.
 
         This decorator must be applied to SocketIO event handlers. Example::
@@ -287,10 +824,36 @@ class SocketIO:
                         events.
         :param namespace: The namespace on which the handler is to be
                           registered. Defaults to the global namespace.
+        :param time_budget: The maximum time in seconds the handler is
+                            expected to run. When the handler takes longer, a
+                            warning is logged and the :data:`slow_event`
+                            signal is sent. Defaults to the ``time_budget``
+                            given to the ``SocketIO`` constructor.
+        :param executor: Set to ``'process'`` to run the handler in a worker
+                         process, for handlers that do CPU intensive work
+                         that would otherwise block other clients. The
+                         handler and its arguments must be picklable, and
+                         the handler runs without a request context, so it
+                         cannot use ``request``, ``session`` or ``emit()``.
+                         The value returned by the handler is sent to the
+                         client as acknowledgement. The default is ``None``,
+                         which runs the handler in the server process.
         """
         namespace = namespace or '/'
+        if executor not in [None, 'process']:
+            raise ValueError(f'Invalid executor: {executor}')
+        if executor == 'process' and message in ['connect', 'disconnect']:
+            raise ValueError('Connection handlers cannot run in a process')
 
         def decorator(handler):
+            if executor == 'process':
+                if inspect.iscoroutinefunction(handler):
+                    raise ValueError('Coroutine handlers cannot run in a '
+                                     'process')
+                compiled_handler = partial(self.run_in_process, handler)
+            else:
+                compiled_handler = compile_handler(handler, message)
+
             @wraps(handler)
             def _handler(sid, *args):
                 real_ns = namespace
@@ -303,8 +866,8 @@ class SocketIO:
                     real_msg = sid
                     sid = args[0]
                     args = [real_msg] + list(args[1:])
-                return self._handle_event(handler, message, real_ns, sid,
-                                          *args)
+                return self._handle_event(compiled_handler, message, real_ns,
+                                          sid, *args, time_budget=time_budget)
 
             if self.server:
                 self.server.on(message, _handler, namespace=namespace)
@@ -353,7 +916,8 @@ class SocketIO:
         self.default_exception_handler = exception_handler
         return exception_handler
 
-    def on_event(self, message, handler, namespace=None):
+    def on_event(self, message, handler, namespace=None, time_budget=None,
+                 executor=None):
         """Register a SocketIO event handler.
 
         ``on_event`` is the non-decorator version of ``'on'``.
@@ -375,8 +939,14 @@ class SocketIO:
         :param handler: The function that handles the event.
         :param namespace: The namespace on which the handler is to be
                           registered. Defaults to the global namespace.
+        :param time_budget: The maximum time in seconds the handler is
+                            expected to run. Defaults to the ``time_budget``
+                            given to the ``SocketIO`` constructor.
+        :param executor: Set to ``'process'`` to run the handler in a worker
+                         process. See ``on()`` for details.
         """
-        self.on(message, namespace=namespace)(handler)
+        self.on(message, namespace=namespace, time_budget=time_budget,
+                executor=executor)(handler)
 
     def event(self, *args, **kwargs):
         """Decorator to register an event handler.
@@ -437,7 +1007,10 @@ class SocketIO:
                 socketio.emit('ping event', {'data': 42}, namespace='/chat')
 
         :param event: The name of the user event to emit.
-        :param args: A dictionary with the JSON data to send as payload.
+        :param args: A dictionary with the JSON data to send as payload. The
+                     arguments can also be :class:`Preserialized` instances,
+                     which are only encoded once for all the emits they are
+                     included in.
         :param namespace: The namespace under which the message is to be sent.
                           Defaults to the global namespace.
         :param to: Send the message to all the users in the given room, or to
@@ -483,9 +1056,38 @@ class SocketIO:
                 # we only use it if the emit was issued from a Socket.IO
                 # populated request context (i.e. request.sid is defined)
                 callback = _callback_wrapper
+        if not self.encode_once:
+            args = unwrap(args)
+        if self.metrics is not None:
+            self.metrics.record_emit(namespace, event, to=to,
+                                     skip_sid=skip_sid)
         self.server.emit(event, *args, namespace=namespace, to=to,
                          skip_sid=skip_sid, callback=callback, **kwargs)
 
+    def preserialize(self, data, version=None):
+        """Return a :class:`Preserialized` argument for the given data.
+
+        The JSON encoding of a preserialized argument is generated the first
+        time it is emitted, and reused in all the emits that include it. The
+        arguments are kept in a least recently used cache, keyed by the
+        identity of the data and a version, so that calling this method again
+        with the same data and version returns the same argument. When the
+        data is modified, the version must change for the new contents to be
+        encoded. Example::
+
+            def broadcast_snapshot(snapshot, rooms):
+                payload = socketio.preserialize(snapshot,
+                                                version=snapshot['seq'])
+                for room in rooms:
+                    socketio.emit('snapshot', payload, to=room)
+
+        :param data: The argument, which must be JSON serializable. Binary
+                     data is not supported.
+        :param version: A hashable value that identifies the contents of
+                        the data.
+        """
+        return self.preserialize_cache.get(data, version)
+
     def call(self, event, *args, **kwargs):  # pragma: no cover
         """Emit a SocketIO event and wait for the response.
 
@@ -601,12 +1203,22 @@ class SocketIO:
                                       Werkzeug web server in a production
                                       setting. Default is ``False``. Set to
                                       ``True`` at your own risk.
+        :param workers: The number of worker processes. The default is 1.
+                        With more than one worker, the processes share the
+                        listening socket and are restarted if they exit, and
+                        unless a message queue is configured, a local message
+                        queue is started to connect them. Only the WebSocket
+                        transport is accepted in this mode. Not available in
+                        the ``gevent_uwsgi`` and ``asgi`` async modes.
         :param kwargs: Additional web server options. The web server options
                        are specific to the server used in each of the supported
                        async modes. Note that options provided here will
                        not be seen when using an external web server such
                        as gunicorn, since this method is not called in that
                        case.
+
+        In the ``asgi`` async mode the application is served with uvicorn,
+        and the reloader and the debugger are not available.
         """
         if host is None:
             host = '127.0.0.1'
@@ -624,8 +1236,24 @@ class SocketIO:
         reloader_options = kwargs.pop('reloader_options', {})
         if extra_files:
             reloader_options['extra_files'] = extra_files
+        workers = kwargs.pop('workers', 1)
 
         app.debug = debug
+        allow_unsafe_werkzeug = kwargs.pop('allow_unsafe_werkzeug', False)
+        if workers > 1:
+            if use_reloader:
+                raise ValueError('The reloader cannot be used with multiple '
+                                 'workers')
+            if self.server.eio.async_mode == 'threading':
+                self._check_werkzeug(allow_unsafe_werkzeug)
+            return self._run_workers(app, host, port, workers, log_output,
+                                     **kwargs)
+        if self.server.eio.async_mode == 'asgi':
+            import uvicorn
+            uvicorn.run(self.asgi_app, host=host, port=port,
+                        log_level='info' if log_output else 'warning',
+                        **kwargs)
+            return
         if app.debug and self.server.eio.async_mode != 'threading':
             # put the debug middleware between the SocketIO middleware
             # and the Flask application instance
@@ -651,26 +1279,8 @@ class SocketIO:
             self.sockio_mw.wsgi_app = DebuggedApplication(
                 self.sockio_mw.wsgi_app, evalex=True)
 
-        allow_unsafe_werkzeug = kwargs.pop('allow_unsafe_werkzeug', False)
         if self.server.eio.async_mode == 'threading':
-            try:
-                import simple_websocket  # noqa: F401
-            except ImportError:
-                from werkzeug._internal import _log
-                _log('warning', 'WebSocket transport not available. Install '
-                                'simple-websocket for improved performance.')
-            if not sys.stdin or not sys.stdin.isatty():  # pragma: no cover
-                if not allow_unsafe_werkzeug:
-                    raise RuntimeError('The Werkzeug web server is not '
-                                       'designed to run in production. Pass '
-                                       'allow_unsafe_werkzeug=True to the '
-                                       'run() method to disable this error.')
-                else:
-                    from werkzeug._internal import _log
-                    _log('warning', ('Werkzeug appears to be used in a '
-                                     'production deployment. Consider '
-                                     'switching to a production web server '
-                                     'instead.'))
+            self._check_werkzeug(allow_unsafe_werkzeug)
             app.run(host=host, port=port, threaded=True,
                     use_reloader=use_reloader, **reloader_options, **kwargs)
         elif self.server.eio.async_mode == 'eventlet':
@@ -686,18 +1296,7 @@ class SocketIO:
                                                   addresses[0][0])
 
                 # If provided an SSL argument, use an SSL socket
-                ssl_args = ['keyfile', 'certfile', 'server_side', 'cert_reqs',
-                            'ssl_version', 'ca_certs',
-                            'do_handshake_on_connect', 'suppress_ragged_eofs',
-                            'ciphers']
-                ssl_params = {k: kwargs[k] for k in kwargs
-                              if k in ssl_args and kwargs[k] is not None}
-                for k in ssl_args:
-                    kwargs.pop(k, None)
-                if len(ssl_params) > 0:
-                    ssl_params['server_side'] = True  # Listening requires true
-                    eventlet_socket = eventlet.wrap_ssl(eventlet_socket,
-                                                        **ssl_params)
+                eventlet_socket = _wrap_eventlet_ssl(eventlet_socket, kwargs)
 
                 eventlet.wsgi.server(eventlet_socket, app,
                                      log_output=log_output, **kwargs)
@@ -739,6 +1338,109 @@ class SocketIO:
             else:
                 self.wsgi_server.serve_forever()
 
+    def _check_werkzeug(self, allow_unsafe_werkzeug):  # pragma: no cover
+        try:
+            import simple_websocket  # noqa: F401
+        except ImportError:
+            from werkzeug._internal import _log
+            _log('warning', 'WebSocket transport not available. Install '
+                            'simple-websocket for improved performance.')
+        if not sys.stdin or not sys.stdin.isatty():
+            if not allow_unsafe_werkzeug:
+                raise RuntimeError('The Werkzeug web server is not '
+                                   'designed to run in production. Pass '
+                                   'allow_unsafe_werkzeug=True to the '
+                                   'run() method to disable this error.')
+            else:
+                from werkzeug._internal import _log
+                _log('warning', ('Werkzeug appears to be used in a '
+                                 'production deployment. Consider '
+                                 'switching to a production web server '
+                                 'instead.'))
+
+    def _run_workers(self, app, host, port, workers, log_output,
+                     **kwargs):  # pragma: no cover
+        if self.async_mode not in ['threading', 'eventlet', 'gevent']:
+            raise ValueError('Multiple workers are not supported in the '
+                             f'{self.async_mode} async mode')
+        if self.async_mode == 'threading':
+            # these are the options of app.run() that apply to a server
+            # created on an existing socket
+            unsupported = set(kwargs) - {'request_handler',
+                                         'passthrough_errors', 'ssl_context'}
+            if unsupported:
+                raise ValueError('Unsupported web server options with '
+                                 'multiple workers: '
+                                 f'{", ".join(sorted(unsupported))}')
+        listener = socket.create_server(
+            (host, port), backlog=2048,
+            family=socket.AF_INET6 if ':' in host else socket.AF_INET)
+        queue_dir = None
+        if not isinstance(self.server.manager, socketio.PubSubManager):
+            queue_dir = tempfile.mkdtemp(prefix='flask-socketio-')
+        # the requests of a long-polling client could be received by
+        # different workers, so only WebSocket connections are accepted
+        self.server.eio.transports = ['websocket']
+
+        def worker():
+            self._init_worker_queue(os.path.join(queue_dir, 'queue.sock')
+                                    if queue_dir is not None else None)
+            if self.lag_monitor is not None:
+                # background tasks are not inherited by forked processes
+                self.lag_monitor.start(self)
+            if self.async_mode == 'threading':
+                from werkzeug.serving import make_server
+                make_server(host, port, app, threaded=True,
+                            fd=listener.fileno(), **kwargs).serve_forever()
+            elif self.async_mode == 'eventlet':
+                import eventlet.wsgi
+                from eventlet.greenio import GreenSocket
+                eventlet.wsgi.server(
+                    _wrap_eventlet_ssl(GreenSocket(listener), kwargs), app,
+                    log_output=log_output, **kwargs)
+            else:
+                from gevent import pywsgi
+                try:
+                    from geventwebsocket.handler import WebSocketHandler
+                    kwargs['handler_class'] = WebSocketHandler
+                except ImportError:
+                    pass
+                pywsgi.WSGIServer(listener, app,
+                                  log='default' if log_output else None,
+                                  **kwargs).serve_forever()
+
+        from .workers import Supervisor
+        try:
+            Supervisor(workers, worker,
+                       queue_path=os.path.join(queue_dir, 'queue.sock')
+                       if queue_dir else None).run()
+        finally:
+            listener.close()
+            if queue_dir is not None:
+                shutil.rmtree(queue_dir, ignore_errors=True)
+
+    def _init_worker_queue(self, queue_path=None):
+        """Give a forked worker process its own message queue client.
+
+        The client inherited from the parent process has the same host id as
+        the clients of the other workers, so the messages they publish would
+        be discarded as its own, and its connections and background tasks do
+        not survive the fork.
+        """
+        if queue_path is not None:
+            from .unix_manager import UnixSocketManager
+            manager = pubsub_class(UnixSocketManager)(
+                queue_path, channel='flask-socketio')
+        elif self.queue_factory is not None:
+            manager = self.queue_factory()
+        else:
+            # a client manager given by the application cannot be recreated
+            manager = self.server.manager
+            manager.host_id = uuid.uuid4().hex
+        manager.set_server(self.server)
+        self.server.manager = manager
+        self.server.manager_initialized = False
+
     def stop(self):
         """Stop a running SocketIO web server.
 
@@ -754,6 +1456,24 @@ class SocketIO:
             raise SystemExit
         elif self.server.eio.async_mode == 'gevent':
             self.wsgi_server.stop()
+        elif self.server.eio.async_mode == 'asgi':
+            raise RuntimeError('The ASGI server must be stopped by the '
+                               'process that runs it')
+
+    def flush(self):
+        """Publish the emits that are waiting to be published to the message
+        queue as a batch.
+
+        This method only has an effect when the ``batch_window`` option is
+        set. Example::
+
+            for progress in range(100):
+                socketio.emit('progress', progress, to=task_id)
+            socketio.flush()
+        """
+        flush = getattr(self.server.manager, 'flush', None)
+        if flush is not None:
+            flush()
 
     def start_background_task(self, target, *args, **kwargs):
         """Start a background task using the appropriate async model.
@@ -772,6 +1492,36 @@ class SocketIO:
         """
         return self.server.start_background_task(target, *args, **kwargs)
 
+    def run_in_process(self, func, *args):
+        """Run a function in a worker process and return its result.
+
+        This is a utility function that event handlers can use to run CPU
+        intensive code without blocking other clients. The calling task
+        waits for the result without blocking the server. Example::
+
+            @socketio.on('thumbnail')
+            def handle_thumbnail(image):
+                thumbnail = socketio.run_in_process(make_thumbnail, image)
+                emit('thumbnail', thumbnail)
+
+        :param func: The function to run. It must be picklable, which
+                     typically means that it must be defined at the top level
+                     of a module.
+        :param args: The arguments to pass to the function, which must also
+                     be picklable.
+        """
+        if self.process_pool is None:
+            with self.process_pool_lock:
+                if self.process_pool is None:
+                    self.process_pool = ProcessPoolExecutor(
+                        max_workers=self.process_pool_workers)
+        future = self.process_pool.submit(func, *args)
+        if self.async_mode != 'threading':
+            # wait without blocking the event loop
+            while not future.done():
+                self.sleep(0.01)
+        return future.result()
+
     def sleep(self, seconds=0):
         """Sleep for the requested amount of time using the appropriate async
         model.
@@ -801,61 +1551,110 @@ class SocketIO:
                                   want the Flask user session and any other
                                   cookies set in HTTP routes accessible from
                                   Socket.IO events.
+
+        The test client is not available in the ``asgi`` async mode.
         """
+        if self.async_mode == 'asgi':
+            raise RuntimeError('The test client is not supported in the asgi '
+                               'async mode')
         return SocketIOTestClient(app, self, namespace=namespace,
                                   query_string=query_string, headers=headers,
                                   auth=auth,
                                   flask_test_client=flask_test_client)
 
-    def _handle_event(self, handler, message, namespace, sid, *args):
+    def _report_slow_event(self, app, namespace, event, sid, elapsed,
+                           time_budget):
+        app.logger.warning(
+            'Handler for event "%s" on namespace "%s" (sid %s) took %.3f '
+            'seconds, exceeding its time budget of %.3f seconds', event,
+            namespace, sid, elapsed, time_budget)
+        slow_event.send(self, namespace=namespace, event=event, sid=sid,
+                        elapsed=elapsed, time_budget=time_budget)
+
+    @contextmanager
+    def _request_context(self, app, environ, namespace, session=None):
+        if not self.light_context:
+            ctx = app.request_context(environ)
+            if session is not None:
+                # installing the session before the context is pushed
+                # prevents Flask from opening the user session
+                self.session_injector.inject(ctx, session)
+            try:
+                with ctx:
+                    yield ctx
+            finally:
+                if self.retain_environ is not None:
+                    # werkzeug stores the request in the environ, which
+                    # would keep it in memory for the life of the connection
+                    environ.pop('werkzeug.request', None)
+            return
+
+        # reuse the request context built for a previous event of this client
+        # the context is removed from the environ while in use, so that
+        # concurrent events from the same client get their own context
+        contexts = environ.setdefault('flask_socketio.contexts', {})
+        ctx = contexts.pop(namespace, None)
+        if ctx is None:
+            ctx = app.request_context(environ)
+            if session is not None:
+                self.session_injector.inject(ctx, session)
+        elif not self.manage_session:
+            # reopen the user session, as it may have been modified by HTTP
+            # routes since the previous event
+            self.session_injector.inject(ctx, None)
+        try:
+            with ctx:
+                yield ctx
+        finally:
+            contexts[namespace] = ctx
+            if self.retain_environ is not None:
+                # the request is kept by the context, the environ does not
+                # need another reference to it
+                environ.pop('werkzeug.request', None)
+
+    def _handle_event(self, handler, message, namespace, sid, *args,
+                      time_budget=None):
         environ = self.server.get_environ(sid, namespace=namespace)
         if not environ:
             # we don't have record of this client, ignore this event
             return '', 400
         app = environ['flask.app']
-        with app.request_context(environ):
-            if self.manage_session:
-                # manage a separate session for this client's Socket.IO events
-                # created as a copy of the regular user session
-                if 'saved_session' not in environ:
-                    environ['saved_session'] = _ManagedSession(flask.session)
-                session_obj = environ['saved_session']
-                if hasattr(flask, 'globals') and \
-                        hasattr(flask.globals, 'app_ctx'):
-                    if hasattr(flask.globals.app_ctx, 'session'):
-                        # get context for flask >= 3.2
-                        ctx = flask.globals.app_ctx._get_current_object()
-                    else:
-                        # get context for Flask >= 2.2, < 3.2
-                        ctx = flask.globals.request_ctx._get_current_object()
-                else:  # pragma: no cover
-                    # get context for Flask < 2.2
-                    ctx = flask._request_ctx_stack.top
-                if hasattr(ctx, '_session'):
-                    # update session for Flask >= 3.1.3
-                    ctx._session = session_obj
-                else:
-                    # update session for Flask < 3.1.3
-                    ctx.session = session_obj
-            else:
+        session_obj = None
+        if self.manage_session:
+            # manage a separate session for this client's Socket.IO events
+            # created as a copy of the regular user session the first time
+            # it is accessed
+            session_obj = environ.get('saved_session')
+            if session_obj is None:
+                session_obj = environ['saved_session'] = _ManagedSession(
+                    loader=partial(_open_user_session, app, environ))
+        with self._request_context(app, environ, namespace,
+                                   session_obj) as ctx:
+            if not self.manage_session:
                 # let Flask handle the user session
                 # for cookie based sessions, this effectively freezes the
                 # session to its state at connection time
                 # for server-side sessions, this allows HTTP and Socket.IO to
                 # share the session, with both having read/write access to it
-                session_obj = flask.session._get_current_object()
+                # the session is wrapped to know if it needs to be saved
+                session_obj = _TrackedSession(
+                    flask.session._get_current_object())
+                self.session_injector.inject(ctx, session_obj)
             flask.request.sid = sid
             flask.request.namespace = namespace
             flask.request.event = {'message': message, 'args': args}
+            if self.profiler is not None and message is not None:
+                handler = self.profiler.wrap(handler, namespace, message)
+            if time_budget is None:
+                time_budget = self.time_budget
+            start = time.perf_counter() \
+                if time_budget is not None and message is not None else None
             try:
-                if message == 'connect':
-                    auth = args[1] if len(args) > 1 else None
-                    try:
-                        ret = handler(auth)
-                    except TypeError:
-                        ret = handler()
-                else:
+                if self.metrics is None or message is None:
                     ret = handler(*args)
+                else:
+                    ret = self.metrics.handle_event(handler, namespace,
+                                                    message, *args)
             except ConnectionRefusedError:
                 raise  # let this error bubble up to python-socketio
             except Exception:
@@ -865,12 +1664,25 @@ class SocketIO:
                     raise
                 type, value, traceback = sys.exc_info()
                 return err_handler(value)
-            if not self.manage_session:
+            finally:
+                if start is not None:
+                    elapsed = time.perf_counter() - start
+                    if elapsed > time_budget:
+                        self._report_slow_event(app, namespace, message, sid,
+                                                elapsed, time_budget)
+            if not self.manage_session and session_obj.modified:
                 # when Flask is managing the user session, it needs to save it
-                if not hasattr(session_obj, 'modified') or \
-                        session_obj.modified:
-                    resp = app.response_class()
-                    app.session_interface.save_session(app, session_obj, resp)
+                # session interfaces that support partial updates are given
+                # the keys that were changed by the handler
+                resp = app.response_class()
+                session_interface = app.session_interface
+                if hasattr(session_interface, 'save_session_changes'):
+                    session_interface.save_session_changes(
+                        app, session_obj.session, resp,
+                        session_obj.dirty_keys)
+                else:
+                    session_interface.save_session(app, session_obj.session,
+                                                   resp)
             return ret
 
 
@@ -887,7 +1699,8 @@ def emit(event, *args, **kwargs):
             emit('my response', {'data': 42})
 
     :param event: The name of the user event to emit.
-    :param args: A dictionary with the JSON data to send as payload.
+    :param args: A dictionary with the JSON data to send as payload, or a
+                 :class:`Preserialized` argument.
     :param namespace: The namespace under which the message is to be sent.
                       Defaults to the namespace used by the originating event.
                       A ``'/'`` can be used to explicitly specify the global
@@ -0,0 +1,203 @@
+import asyncio
+from functools import partial
+import inspect
+import io
+import threading
+import time
+
+import socketio
+
+
+class _FlaskASGIApp:
+    """This ASGI application serves the regular Flask routes. The WSGI to
+    ASGI adapter is imported when the first request arrives, so that it is
+    only required when the Flask routes are used."""
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.asgi_app = None
+
+    async def __call__(self, scope, receive, send):
+        if self.asgi_app is None:
+            from asgiref.wsgi import WsgiToAsgi
+            self.asgi_app = WsgiToAsgi(self.flask_app)
+        return await self.asgi_app(scope, receive, send)
+
+
+class _AsyncSocketIOServer(socketio.AsyncServer):
+    """The asyncio Socket.IO server used by Flask-SocketIO in the ``asgi``
+    async mode."""
+    flask_app = None
+    retain_environ = None
+    loop = None
+
+    async def handle_request(self, *args, **kwargs):
+        self.loop = asyncio.get_running_loop()
+        return await super().handle_request(*args, **kwargs)
+
+    async def _handle_eio_connect(self, eio_sid, environ):
+        # complete the environ built by the ASGI driver, so that Flask can
+        # create a request context from it
+        scope = environ.get('asgi.scope', {})
+        environ['wsgi.url_scheme'] = 'https' if scope.get('scheme') in [
+            'https', 'wss'] else 'http'
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        environ['wsgi.input'] = io.BytesIO()
+        environ['flask.app'] = self.flask_app
+        return await super()._handle_eio_connect(eio_sid, environ)
+
+    async def _handle_connect(self, eio_sid, namespace, data):
+        try:
+            await super()._handle_connect(eio_sid, namespace, data)
+        finally:
+            if self.retain_environ is not None and eio_sid in self.environ:
+                from . import _trim_environ
+                _trim_environ(self.environ[eio_sid], self.retain_environ)
+
+    async def _trigger_event(self, event, namespace, *args):
+        # see _SocketIOServer._trigger_event
+        if event == 'connect' and len(args) < 3:
+            raise TypeError('connect handler already invoked')
+        if event != 'disconnect':
+            return await super()._trigger_event(event, namespace, *args)
+        handler, args = self._get_event_handler(event, namespace, args)
+        if handler:
+            if not inspect.iscoroutinefunction(handler):
+                return handler(*args)
+            try:
+                return await handler(*args)
+            except asyncio.CancelledError:  # pragma: no cover
+                return None
+        handler, args = self._get_namespace_handler(namespace, args)
+        if handler:
+            return await handler.trigger_event(event, *args)
+        return self.not_handled
+
+
+class _AsyncNamespace(socketio.AsyncNamespace):
+    """This namespace forwards the events received by the asyncio server to
+    a Flask-SocketIO namespace, which runs in a worker thread."""
+    def __init__(self, namespace_handler, bridge):
+        super().__init__(namespace_handler.namespace)
+        self.namespace_handler = namespace_handler
+        self.bridge = bridge
+
+    async def trigger_event(self, event, *args):
+        return await self.bridge.run_sync(self.namespace_handler.trigger_event,
+                                          event, *args)
+
+
+class _AsyncServerBridge:
+    """Expose an asyncio Socket.IO server through the synchronous interface
+    of ``socketio.Server``.
+
+    The Flask handlers registered with the server run in worker threads, with
+    the same app and request contexts they have in the other async modes. The
+    server methods that are coroutines are scheduled on the event loop of the
+    server, and block the calling thread until they complete.
+    """
+    def __init__(self, flask_app=None, **kwargs):
+        kwargs['async_mode'] = 'asgi'
+        self.server = _AsyncSocketIOServer(**kwargs)
+        self.server.flask_app = flask_app
+        self.async_mode = 'asgi'
+
+    def __getattr__(self, name):
+        return getattr(self.server, name)
+
+    @property
+    def retain_environ(self):
+        return self.server.retain_environ
+
+    @retain_environ.setter
+    def retain_environ(self, value):
+        self.server.retain_environ = value
+
+    def asgi_app(self, flask_app, socketio_path='socket.io'):
+        """Return the ASGI application that serves Socket.IO traffic with
+        this server, and forwards all other requests to the Flask
+        application."""
+        self.server.flask_app = flask_app
+
+        async def on_startup():
+            self.server.loop = asyncio.get_running_loop()
+
+        return socketio.ASGIApp(self.server,
+                                other_asgi_app=_FlaskASGIApp(flask_app),
+                                socketio_path=socketio_path,
+                                on_startup=on_startup)
+
+    async def run_sync(self, func, *args):
+        """Run a synchronous function in a worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(func, *args))
+
+    def _async(self, func):
+        if func is None or inspect.iscoroutinefunction(func):
+            return func
+
+        async def async_func(*args):
+            return await self.run_sync(func, *args)
+
+        return async_func
+
+    def _run(self, coro):
+        loop = self.server.loop
+        if loop is None:
+            coro.close()
+            raise RuntimeError('The ASGI server is not running')
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            # called from the event loop, so it cannot block
+            return loop.create_task(coro)
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def on(self, event, handler=None, namespace=None):
+        if handler is None:
+            return lambda handler: self.on(event, handler, namespace)
+        return self.server.on(event, self._async(handler),
+                              namespace=namespace)
+
+    def register_namespace(self, namespace_handler):
+        namespace_handler._set_server(self)
+        self.server.register_namespace(_AsyncNamespace(namespace_handler,
+                                                       self))
+
+    def emit(self, event, data=None, callback=None, **kwargs):
+        return self._run(self.server.emit(event, data=data,
+                                          callback=self._async(callback),
+                                          **kwargs))
+
+    def send(self, data, callback=None, **kwargs):
+        return self._run(self.server.send(data, callback=self._async(callback),
+                                          **kwargs))
+
+    def call(self, event, data=None, **kwargs):
+        return self._run(self.server.call(event, data=data, **kwargs))
+
+    def enter_room(self, sid, room, namespace=None):
+        return self._run(self.server.enter_room(sid, room,
+                                                namespace=namespace))
+
+    def leave_room(self, sid, room, namespace=None):
+        return self._run(self.server.leave_room(sid, room,
+                                                namespace=namespace))
+
+    def close_room(self, room, namespace=None):
+        return self._run(self.server.close_room(room, namespace=namespace))
+
+    def disconnect(self, sid, namespace=None, ignore_queue=False):
+        return self._run(self.server.disconnect(sid, namespace=namespace,
+                                                ignore_queue=ignore_queue))
+
+    def start_background_task(self, target, *args, **kwargs):
+        thread = threading.Thread(target=target, args=args, kwargs=kwargs,
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def sleep(self, seconds=0):
+        time.sleep(seconds)
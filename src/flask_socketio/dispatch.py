@@ -0,0 +1,89 @@
+import asyncio
+from functools import wraps
+import inspect
+import os
+import threading
+
+# the event loop that runs coroutine handlers, in a background thread of each
+# process
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+def _accepts_argument(handler):
+    """Return ``True`` if the given function can be called with one
+    positional argument."""
+    try:
+        signature = inspect.signature(handler)
+    except (TypeError, ValueError):  # pragma: no cover
+        # the signature cannot be inspected, so assume the handler follows
+        # the current calling conventions
+        return True
+    for param in signature.parameters.values():
+        if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD,
+                          param.VAR_POSITIONAL):
+            return True
+    return False
+
+
+def _get_event_loop():
+    """Return the event loop that runs coroutine handlers, starting it if
+    necessary."""
+    global _loop, _loop_pid
+    if _loop_pid != os.getpid():
+        with _loop_lock:
+            if _loop_pid != os.getpid():
+                # the loop thread does not survive a fork, so each process
+                # starts its own
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True,
+                                 name='flask-socketio-asyncio').start()
+                _loop = loop
+                _loop_pid = os.getpid()
+    return _loop
+
+
+def _sync_handler(handler):
+    """Return a function that runs a coroutine handler on the shared event
+    loop and waits for its result."""
+    @wraps(handler)
+    def run_coroutine(*args):
+        # the coroutine runs in a copy of the current context, so the Flask
+        # request context is available to it
+        return asyncio.run_coroutine_threadsafe(
+            handler(*args), _get_event_loop()).result()
+    return run_coroutine
+
+
+def compile_handler(handler, message):
+    """Return a function that invokes an event handler with the arguments it
+    expects.
+
+    The connect and disconnect handlers can be written with or without their
+    ``auth`` and ``reason`` arguments respectively. The signature of the
+    handler is inspected once when it is registered, so that each event is
+    dispatched with a single call.
+
+    Handlers defined with ``async def`` run on an event loop that is shared
+    by all the coroutine handlers of the process.
+
+    :param handler: The event handler function.
+    :param message: The name of the event the handler is registered for.
+    """
+    if inspect.iscoroutinefunction(handler):
+        handler = _sync_handler(handler)
+    if message == 'connect':
+        accepts_auth = _accepts_argument(handler)
+
+        def connect_handler(*args):
+            return handler(args[1]) if accepts_auth else handler()
+        return connect_handler
+    elif message == 'disconnect':
+        # legacy disconnect handlers do not have the reason argument
+        accepts_reason = _accepts_argument(handler)
+
+        def disconnect_handler(*args):
+            return handler(*args) if accepts_reason else handler()
+        return disconnect_handler
+    return handler
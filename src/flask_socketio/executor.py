@@ -0,0 +1,138 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import threading
+
+default_logger = logging.getLogger('flask_socketio.executor')
+
+
+class HandlerExecutor:
+    """Run event handlers on a bounded pool of reusable threads.
+
+    An instance of this class is created when the ``executor`` option of the
+    :class:`SocketIO` class is given, and is available as
+    ``socketio.server.executor``. It is only supported in the ``threading``
+    async mode, where each event would otherwise be handled in a new thread.
+
+    :param max_workers: The maximum number of worker threads. The default is
+                        the number of CPUs plus four, with a maximum of 32.
+    :param queue_size: The maximum number of events that can be waiting for
+                       a worker thread. The default is 1000. Set to ``None``
+                       for an unbounded queue.
+    :param rejection_policy: What to do with an event that arrives when the
+                             queue is full. ``'block'`` (the default) waits
+                             until there is room in the queue, which applies
+                             backpressure to the client connection.
+                             ``'caller_runs'`` handles the event in the
+                             thread that received it. ``'drop'`` discards the
+                             event and logs a warning.
+    :param ordered: If set to ``True``, the events of each client are handled
+                    one at a time, in the order they were received, while
+                    events from different clients are handled in parallel.
+                    The ``'caller_runs'`` rejection policy cannot be used in
+                    this mode, as it would break the ordering. The default is
+                    ``False``.
+    :param logger: The logger to use. Defaults to the
+                   ``flask_socketio.executor`` logger.
+    """
+    rejection_policies = ['block', 'caller_runs', 'drop']
+
+    def __init__(self, max_workers=None, queue_size=1000,
+                 rejection_policy='block', ordered=False, logger=None):
+        if rejection_policy not in self.rejection_policies:
+            raise ValueError(f'Invalid rejection policy: {rejection_policy}')
+        if ordered and rejection_policy == 'caller_runs':
+            raise ValueError('The caller_runs rejection policy cannot be used '
+                             'with ordered execution')
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.queue_size = queue_size
+        self.rejection_policy = rejection_policy
+        self.ordered = ordered
+        self.logger = logger or default_logger
+        self.pool = ThreadPoolExecutor(self.max_workers,
+                                       thread_name_prefix='flask-socketio')
+        self.slots = threading.Semaphore(self.max_workers + queue_size) \
+            if queue_size is not None else None
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.pending = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, func, *args, key=None):
+        """Run a function on a worker thread, or apply the rejection policy
+        if the queue is full.
+
+        :param func: The function to run.
+        :param args: The arguments for the function.
+        :param key: In ordered mode, functions submitted with the same key
+                    run one at a time, in the order they were submitted.
+        """
+        if self.slots is not None and not self.slots.acquire(
+                blocking=self.rejection_policy == 'block'):
+            with self.lock:
+                self.rejected += 1
+            if self.rejection_policy == 'caller_runs':
+                func(*args)
+            else:
+                self.logger.warning('Executor queue is full, event dropped')
+            return
+        if self.ordered and key is not None:
+            with self.lock:
+                self.pending += 1
+                queue = self.queues.get(key)
+                if queue is not None:
+                    # a worker is already handling this key, and will pick
+                    # this function up when it is done with the previous ones
+                    queue.append((func, args))
+                    return
+                self.queues[key] = deque([(func, args)])
+            self.pool.submit(self._run_queue, key)
+            return
+        with self.lock:
+            self.pending += 1
+        self.pool.submit(self._run, func, args)
+
+    def _run_queue(self, key):
+        while True:
+            with self.lock:
+                queue = self.queues[key]
+                if not queue:
+                    del self.queues[key]
+                    return
+                func, args = queue.popleft()
+            self._run(func, args)
+
+    def _run(self, func, args):
+        with self.lock:
+            self.pending -= 1
+            self.active += 1
+        try:
+            func(*args)
+        except Exception:
+            self.logger.exception('Event handler error')
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.completed += 1
+            if self.slots is not None:
+                self.slots.release()
+
+    def stats(self):
+        """Return a dictionary with the current state of the executor."""
+        with self.lock:
+            return {'max_workers': self.max_workers,
+                    'queue_size': self.queue_size,
+                    'active': self.active,
+                    'queued': self.pending,
+                    'completed': self.completed,
+                    'rejected': self.rejected}
+
+    def shutdown(self, wait=True):
+        """Stop the worker threads.
+
+        :param wait: If ``True``, wait for queued events to be handled.
+        """
+        self.pool.shutdown(wait=wait)
@@ -0,0 +1,239 @@
+import threading
+import time
+
+from socketio.exceptions import ConnectionRefusedError
+
+#: Upper bounds of the handler latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+#: Upper bounds of the emit fan-out histogram buckets, in recipients.
+FANOUT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000,
+                  10000)
+
+#: Upper bounds of the event loop lag histogram buckets, in seconds.
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+               5.0, 10.0)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {'count': self.count, 'sum': self.sum, 'buckets': buckets}
+
+
+class _EventStats:
+    def __init__(self):
+        self.errors = 0
+        self.latency = _Histogram(LATENCY_BUCKETS)
+
+
+class Metrics:
+    """Collect metrics for a Flask-SocketIO server.
+
+    An instance of this class is created when the ``metrics`` option of the
+    :class:`SocketIO` class is set to ``True``, and is available as
+    ``socketio.metrics``. The following metrics are collected:
+
+    - The number of events handled, the number of events with handlers that
+      raised an exception, and a histogram of handler durations, for each
+      namespace and event.
+    - A histogram of the number of recipients of each emit, for each namespace
+      and event. When a message queue is used, only the clients that are
+      connected to this server are counted.
+    - The number of active connections, for each namespace.
+    - A histogram of the event loop lag, when the lag monitor is enabled.
+    - The number of active and queued handlers, and the number of rejected
+      events, when a handler executor is configured.
+
+    The metrics can be obtained as a dictionary with :meth:`snapshot`, or in
+    the Prometheus text format with :meth:`prometheus`. Call :meth:`mount` to
+    add a Flask route that serves them.
+    """
+    def __init__(self):
+        self.server = None
+        self.events = {}
+        self.emits = {}
+        self.loop_lag = _Histogram(LAG_BUCKETS)
+        self.lock = threading.Lock()
+
+    def init_server(self, server):
+        self.server = server
+
+    def handle_event(self, handler, namespace, event, *args):
+        """Invoke an event handler and record its metrics."""
+        start = time.perf_counter()
+        error = False
+        try:
+            return handler(*args)
+        except ConnectionRefusedError:
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                stats = self.events.get((namespace, event))
+                if stats is None:
+                    stats = self.events[(namespace, event)] = _EventStats()
+                stats.latency.observe(duration)
+                if error:
+                    stats.errors += 1
+
+    def record_emit(self, namespace, event, to=None, skip_sid=None):
+        """Record the number of local recipients of an emit."""
+        rooms = self.server.manager.rooms.get(namespace, {})
+        targets = to if isinstance(to, (list, tuple, set)) else [to]
+        recipients = sum(len(rooms.get(room, ())) for room in targets)
+        if skip_sid:
+            if not isinstance(skip_sid, (list, tuple, set)):
+                skip_sid = [skip_sid]
+            recipients -= sum(1 for sid in skip_sid if any(
+                sid in rooms.get(room, ()) for room in targets))
+        with self.lock:
+            fanout = self.emits.get((namespace, event))
+            if fanout is None:
+                fanout = self.emits[(namespace, event)] = _Histogram(
+                    FANOUT_BUCKETS)
+            fanout.observe(recipients)
+
+    def record_loop_lag(self, lag):
+        """Record a measurement of the event loop lag."""
+        with self.lock:
+            self.loop_lag.observe(lag)
+
+    def connections(self):
+        """Return the number of active connections on each namespace."""
+        if self.server is None:
+            return {}
+        rooms = self.server.manager.rooms
+        return {namespace: len(rooms[namespace].get(None, ()))
+                for namespace in list(rooms)}
+
+    def snapshot(self):
+        """Return the current metrics as a dictionary."""
+        with self.lock:
+            events = {key: {'count': stats.latency.count,
+                            'errors': stats.errors,
+                            'latency': stats.latency.to_dict()}
+                      for key, stats in self.events.items()}
+            emits = {key: fanout.to_dict()
+                     for key, fanout in self.emits.items()}
+            loop_lag = self.loop_lag.to_dict()
+        executor = getattr(self.server, 'executor', None)
+        return {'events': events, 'emits': emits, 'loop_lag': loop_lag,
+                'connections': self.connections(),
+                'executor': executor.stats() if executor else None}
+
+    def prometheus(self):
+        """Return the current metrics in the Prometheus text format."""
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, type, help):
+            lines.append(f'# HELP flask_socketio_{name} {help}')
+            lines.append(f'# TYPE flask_socketio_{name} {type}')
+
+        def histogram(name, labels, data):
+            for bound, count in data['buckets'].items():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = f'{labels},le="{le}"' if labels \
+                    else f'le="{le}"'
+                lines.append(f'flask_socketio_{name}_bucket'
+                             f'{{{bucket_labels}}} {count}')
+            labels = f'{{{labels}}}' if labels else ''
+            lines.append(f'flask_socketio_{name}_sum{labels} {data["sum"]}')
+            lines.append(f'flask_socketio_{name}_count{labels} '
+                         f'{data["count"]}')
+
+        events = sorted(snapshot['events'].items(), key=_sort_key)
+        metric('events_total', 'counter', 'Number of events handled.')
+        for (namespace, event), stats in events:
+            lines.append(f'flask_socketio_events_total'
+                         f'{{{_labels(namespace, event)}}} {stats["count"]}')
+        metric('event_errors_total', 'counter',
+               'Number of event handlers that raised an exception.')
+        for (namespace, event), stats in events:
+            lines.append(f'flask_socketio_event_errors_total'
+                         f'{{{_labels(namespace, event)}}} {stats["errors"]}')
+        metric('handler_duration_seconds', 'histogram',
+               'Duration of event handlers.')
+        for (namespace, event), stats in events:
+            histogram('handler_duration_seconds', _labels(namespace, event),
+                      stats['latency'])
+        metric('emit_recipients', 'histogram',
+               'Number of local recipients of emitted events.')
+        for (namespace, event), fanout in sorted(snapshot['emits'].items(),
+                                                 key=_sort_key):
+            histogram('emit_recipients', _labels(namespace, event), fanout)
+        if snapshot['loop_lag']['count']:
+            metric('loop_lag_seconds', 'histogram',
+                   'Scheduling lag of the event loop.')
+            histogram('loop_lag_seconds', '', snapshot['loop_lag'])
+        if snapshot['executor']:
+            stats = snapshot['executor']
+            metric('executor_active', 'gauge',
+                   'Number of event handlers running in the executor.')
+            lines.append(f'flask_socketio_executor_active {stats["active"]}')
+            metric('executor_queue_depth', 'gauge',
+                   'Number of events waiting for an executor thread.')
+            lines.append(f'flask_socketio_executor_queue_depth '
+                         f'{stats["queued"]}')
+            metric('executor_rejected_total', 'counter',
+                   'Number of events rejected by a full executor queue.')
+            lines.append(f'flask_socketio_executor_rejected_total '
+                         f'{stats["rejected"]}')
+        metric('connections', 'gauge', 'Number of active connections.')
+        for namespace, count in sorted(snapshot['connections'].items()):
+            lines.append(f'flask_socketio_connections'
+                         f'{{namespace="{_escape(namespace)}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def mount(self, app, rule='/metrics', endpoint='socketio_metrics'):
+        """Add a route to a Flask application that serves the metrics in the
+        Prometheus text format.
+
+        :param app: The Flask application instance.
+        :param rule: The URL rule of the route. The default is
+                     ``'/metrics'``.
+        :param endpoint: The endpoint name of the route.
+        """
+        def metrics_view():
+            return app.response_class(
+                self.prometheus(), mimetype='text/plain; version=0.0.4')
+
+        app.add_url_rule(rule, endpoint, metrics_view)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _labels(namespace, event):
+    return f'namespace="{_escape(namespace)}",event="{_escape(event)}"'
+
+
+def _sort_key(item):
+    return tuple(str(key) for key in item[0])
@@ -0,0 +1,121 @@
+import logging
+import sys
+import time
+import traceback
+
+default_logger = logging.getLogger('flask_socketio.monitor')
+
+
+def _get_original(async_mode, module, name):
+    """Return an attribute of a standard library module, bypassing the monkey
+    patching done by eventlet or gevent."""
+    if async_mode == 'eventlet':
+        from eventlet.patcher import original
+        return getattr(original(module), name)
+    elif async_mode in ['gevent', 'gevent_uwsgi']:
+        from gevent.monkey import get_original
+        return get_original(module, name)
+    return getattr(__import__(module), name)
+
+
+class LagMonitor:
+    """Monitor the scheduling lag of the eventlet or gevent event loop.
+
+    An instance of this class is created when the ``lag_monitor`` option of
+    the :class:`SocketIO` class is set to ``True``, and is available as
+    ``socketio.lag_monitor``. A background task sleeps for ``interval``
+    seconds in a loop, and measures how much later than expected it wakes up.
+    This lag is the time during which the event loop was blocked by code that
+    did not yield, such as a handler that makes a blocking call.
+
+    :param interval: The interval between measurements, in seconds. The
+                     default is 0.5 seconds.
+    :param threshold: The lag above which a warning is logged, in seconds.
+                      The default is 0.1 seconds.
+    :param dump_stacks: If set to ``True``, a watchdog running in a native
+                        thread logs the stack of the code that is blocking the
+                        event loop, as soon as the lag exceeds the threshold.
+                        This is only available with the eventlet and gevent
+                        async modes. The default is ``False``.
+    :param logger: The logger to use. Defaults to the
+                   ``flask_socketio.monitor`` logger.
+
+    The last and maximum lag values are available in the ``last_lag`` and
+    ``max_lag`` attributes. When metrics are enabled, the lag measurements are
+    also recorded in a histogram.
+    """
+    def __init__(self, interval=0.5, threshold=0.1, dump_stacks=False,
+                 logger=None):
+        self.interval = interval
+        self.threshold = threshold
+        self.dump_stacks = dump_stacks
+        self.logger = logger or default_logger
+        self.socketio = None
+        self.last_lag = 0
+        self.max_lag = 0
+        self.heartbeat = None
+        self.loop_thread_id = None
+        self.running = False
+
+    def start(self, socketio):
+        """Start monitoring. This method is invoked by the :class:`SocketIO`
+        instance when it is initialized."""
+        self.socketio = socketio
+        self.running = True
+        self.heartbeat = time.monotonic()
+        socketio.start_background_task(self._run)
+        if self.dump_stacks and socketio.async_mode in [
+                'eventlet', 'gevent', 'gevent_uwsgi']:
+            start_new_thread = _get_original(socketio.async_mode, '_thread',
+                                             'start_new_thread')
+            start_new_thread(self._watchdog, ())
+
+    def stop(self):
+        """Stop monitoring."""
+        self.running = False
+
+    def _run(self):
+        get_ident = _get_original(self.socketio.async_mode, '_thread',
+                                  'get_ident') \
+            if self.dump_stacks else None
+        if get_ident is not None:
+            self.loop_thread_id = get_ident()
+        while self.running:
+            start = time.monotonic()
+            self.heartbeat = start
+            self.socketio.sleep(self.interval)
+            self.record(max(0, time.monotonic() - start - self.interval))
+
+    def record(self, lag):
+        """Record a lag measurement."""
+        self.last_lag = lag
+        if lag > self.max_lag:
+            self.max_lag = lag
+        if self.socketio.metrics is not None:
+            self.socketio.metrics.record_loop_lag(lag)
+        if lag > self.threshold:
+            self.logger.warning('The event loop was blocked for %.3f seconds',
+                                lag)
+
+    def _watchdog(self):
+        sleep = _get_original(self.socketio.async_mode, 'time', 'sleep')
+        reported = None
+        while self.running:
+            sleep(self.threshold / 2)
+            heartbeat = self.heartbeat
+            if heartbeat == reported:
+                # only one report per blocking incident
+                continue
+            if time.monotonic() - heartbeat > self.interval + self.threshold:
+                reported = heartbeat
+                self.dump_stack()
+
+    def dump_stack(self):
+        """Log the stack of the code that is currently running in the event
+        loop thread."""
+        frame = sys._current_frames().get(self.loop_thread_id)
+        if frame is None:  # pragma: no cover
+            return
+        self.logger.warning(
+            'The event loop is blocked by the following code:\n%s',
+            ''.join(traceback.format_stack(frame)))
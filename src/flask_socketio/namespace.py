@@ -1,13 +1,97 @@
+import inspect
+
 from socketio import Namespace as _Namespace
 
+from .dispatch import compile_handler
+
+# incremented every time a handler method is added to or removed from a
+# namespace class or instance, to invalidate the cached dispatch tables
+_handlers_version = 0
+
+
+def _invalidate_handlers():
+    global _handlers_version
+    _handlers_version += 1
+
+
+class _NamespaceMeta(type):
+    def __setattr__(cls, name, value):
+        super().__setattr__(name, value)
+        if name.startswith('on_'):
+            _invalidate_handlers()
+
+    def __delattr__(cls, name):
+        super().__delattr__(name)
+        if name.startswith('on_'):
+            _invalidate_handlers()
+
+
+class Namespace(_Namespace, metaclass=_NamespaceMeta):
+    reserved_events = ['connect', 'disconnect']
+
+    #: A dictionary with the time budgets of the handlers of this namespace,
+    #: in seconds, with the event names as keys. Handlers that are not in
+    #: this dictionary use the default time budget of the ``SocketIO``
+    #: instance.
+    time_budgets = {}
 
-class Namespace(_Namespace):
     def __init__(self, namespace=None):
         super().__init__(namespace)
         self.socketio = None
+        self._handlers = None
+        self._catch_all_handler = None
+        self._handlers_version = None
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name.startswith('on_'):
+            _invalidate_handlers()
+
+    def __delattr__(self, name):
+        super().__delattr__(name)
+        if name.startswith('on_'):
+            _invalidate_handlers()
 
     def _set_socketio(self, socketio):
         self.socketio = socketio
+        self._get_handlers()
+
+    @classmethod
+    def _get_class_handlers(cls):
+        """Return the dispatch table for this class, which maps event names
+        to the unbound handler methods."""
+        handlers = cls.__dict__.get('_class_handlers')
+        if handlers is None or handlers[0] != _handlers_version:
+            table = {}
+            for name in dir(cls):
+                if name.startswith('on_'):
+                    attr = inspect.getattr_static(cls, name)
+                    if callable(getattr(cls, name)):
+                        table[name[3:]] = attr
+            handlers = (_handlers_version, table)
+            cls._class_handlers = handlers
+        return handlers[1]
+
+    def _get_handlers(self):
+        """Return the dispatch table for this instance, which maps event names
+        to bound handlers, compiled for direct invocation. The catch-all
+        handler, if defined, is stored in the ``_catch_all_handler``
+        attribute instead of the table, as no event name can be reserved for
+        it."""
+        if self._handlers_version != _handlers_version:
+            events = set(self._get_class_handlers())
+            events.update(name[3:] for name, value in vars(self).items()
+                          if name.startswith('on_') and callable(value))
+            catch_all = 'catch_all' in events
+            events.discard('catch_all')
+            handlers = {event: compile_handler(getattr(self, 'on_' + event),
+                                               event)
+                        for event in events}
+            self._catch_all_handler = compile_handler(
+                self.on_catch_all, 'catch_all') if catch_all else None
+            self._handlers = handlers
+            self._handlers_version = _handlers_version
+        return self._handlers
 
     def trigger_event(self, event, *args):
         """Dispatch an event to the proper handler method.
@@ -16,22 +100,27 @@ class Namespace(_Namespace):
         as it performs the routing of events to methods. However, this
         method can be overridden if special dispatching rules are needed, or if
         having a single method that catches all events is desired.
+
+        Events that do not have a handler method are passed to the
+        ``on_catch_all`` method if it is defined, with the event name inserted
+        as first argument. The connect and disconnect events are never passed
+        to this method.
         """
-        handler_name = 'on_' + (event or '')
-        if not hasattr(self, handler_name):
-            # there is no handler for this event, so we ignore it
-            return
-        handler = getattr(self, handler_name)
-        try:
-            return self.socketio._handle_event(handler, event, self.namespace,
-                                               *args)
-        except TypeError:
-            if event == 'disconnect':
-                # legacy disconnect events do not have the reason argument
-                return self.socketio._handle_event(
-                    handler, event, self.namespace, *args[:-1])
-            else:
-                raise
+        if self._handlers_version == _handlers_version:
+            handlers = self._handlers
+        else:
+            handlers = self._get_handlers()
+        event = event or ''
+        handler = handlers.get(event)
+        if handler is None:
+            handler = self._catch_all_handler
+            if handler is None or event in self.reserved_events:
+                # there is no handler for this event, so we ignore it
+                return
+            args = (args[0], event, *args[1:])
+        return self.socketio._handle_event(
+            handler, event, self.namespace, *args,
+            time_budget=self.time_budgets.get(event))
 
     def emit(self, event, data=None, room=None, include_self=True,
              namespace=None, callback=None):
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+import threading
+
+from socketio import packet
+
+
+class Preserialized:
+    """An event argument that is encoded to JSON only once.
+
+    The encoded argument is stored in this object the first time it is
+    emitted, and reused by all the emits that include it, so a payload that is
+    broadcast to many rooms, or emitted again without changes, is not encoded
+    again. Instances are usually obtained with :meth:`SocketIO.preserialize`.
+
+    The argument must not be modified after it is first emitted, as later
+    emits would still send the original encoding. Binary data is not
+    supported in preserialized arguments.
+
+    :param data: The argument, which must be JSON serializable.
+    """
+    def __init__(self, data):
+        self.data = data
+        self._encoded = (None, None)
+
+    def encode(self, json):
+        """Return the JSON encoding of the argument, as generated by the
+        given JSON module."""
+        codec, encoded = self._encoded
+        if codec is not json:
+            encoded = json.dumps(self.data, separators=(',', ':'))
+            self._encoded = (json, encoded)
+        return encoded
+
+
+def unwrap(args):
+    """Replace the preserialized arguments in a list or tuple of arguments
+    with their data. Nested tuples, which are expanded to multiple arguments
+    when emitted, are also processed."""
+    return type(args)(
+        arg.data if isinstance(arg, Preserialized)
+        else unwrap(arg) if isinstance(arg, tuple) else arg
+        for arg in args)
+
+
+class _PacketMeta(type):
+    # the JSON module of the packet class is a process-wide setting, which is
+    # shared with the base packet class used by the Socket.IO clients
+    @property
+    def json(cls):
+        return packet.Packet.json
+
+    @json.setter
+    def json(cls, value):
+        packet.Packet.json = value
+
+
+class PreserializedPacket(packet.Packet, metaclass=_PacketMeta):
+    """Socket.IO packet that inserts the cached encoding of its
+    :class:`Preserialized` arguments instead of encoding them again."""
+    def encode(self):
+        if self.packet_type != packet.EVENT or \
+                not isinstance(self.data, list) or \
+                not any(isinstance(arg, Preserialized) for arg in self.data):
+            return super().encode()
+        encoded_packet = str(self.packet_type)
+        if self.namespace is not None and self.namespace != '/':
+            encoded_packet += self.namespace + ','
+        if self.id is not None:
+            encoded_packet += str(self.id)
+        return encoded_packet + '[' + ','.join(
+            arg.encode(self.json) if isinstance(arg, Preserialized)
+            else self.json.dumps(arg, separators=(',', ':'))
+            for arg in self.data) + ']'
+
+
+class PreserializedCache:
+    """A least recently used cache of :class:`Preserialized` arguments, keyed
+    by the identity of their data and a version.
+
+    :param maxsize: The maximum number of arguments in the cache.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, data, version=None):
+        """Return the preserialized argument for the given data and version,
+        creating it if it is not in the cache."""
+        # the cache holds a reference to the data, so its id cannot be reused
+        # by another object while it is in the cache
+        key = (id(data), version)
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                item = self.items[key] = Preserialized(data)
+                while len(self.items) > self.maxsize:
+                    self.items.popitem(last=False)
+            else:
+                self.items.move_to_end(key)
+        return item
@@ -0,0 +1,133 @@
+import cProfile
+import hashlib
+import io
+import os
+import pstats
+import random
+import re
+import threading
+
+
+class Profiler:
+    """Profile a sample of the events handled by a Flask-SocketIO server.
+
+    An instance of this class is created when the ``profiler`` option of the
+    :class:`SocketIO` class is set to a sampling rate, and is available as
+    ``socketio.profiler``. The selected events are handled under
+    :mod:`cProfile`, and the results are aggregated for each namespace and
+    event.
+
+    :param sample_rate: The fraction of events that are profiled, as a number
+                        between 0 and 1. The default is 0.01, which profiles
+                        one out of every hundred events.
+
+    Only one event is profiled at a time. An event that is selected while
+    another one is being profiled is handled without profiling.
+    """
+    def __init__(self, sample_rate=0.01):
+        self.sample_rate = sample_rate
+        self.profiles = {}
+        self.samples = {}
+        # held while an event is profiled
+        self.running = threading.Lock()
+        # held while the results are accessed
+        self.lock = threading.Lock()
+
+    def wrap(self, handler, namespace, event):
+        """Return the handler to invoke for an event, which is a profiled
+        version of the given handler if the event is selected for
+        profiling."""
+        if random.random() >= self.sample_rate:
+            return handler
+
+        def profiled_handler(*args):
+            if not self.running.acquire(blocking=False):
+                # another event is being profiled
+                return handler(*args)
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(handler, *args)
+            finally:
+                self.running.release()
+                # the results of each sample are added to those of the event
+                # without holding the lock while the handler runs
+                key = (namespace, event)
+                with self.lock:
+                    stats = self.profiles.get(key)
+                    if stats is None:
+                        self.profiles[key] = pstats.Stats(
+                            profile, stream=io.StringIO())
+                    else:
+                        stats.add(profile)
+                    self.samples[key] = self.samples.get(key, 0) + 1
+
+        return profiled_handler
+
+    def events(self):
+        """Return a dictionary with the number of profiled samples for each
+        ``(namespace, event)`` tuple."""
+        with self.lock:
+            return dict(self.samples)
+
+    def stats(self, namespace, event):
+        """Return the aggregated profiling results of an event as a
+        ``pstats.Stats`` object, or ``None`` if the event was not profiled.
+
+        :param namespace: The namespace of the event.
+        :param event: The name of the event.
+        """
+        with self.lock:
+            profile = self.profiles.get((namespace, event))
+            if profile is None:
+                return None
+            stats = pstats.Stats(stream=io.StringIO())
+            stats.add(profile)
+            return stats
+
+    def report(self, namespace, event, sort='cumulative', limit=20):
+        """Return the aggregated profiling results of an event as text.
+
+        :param namespace: The namespace of the event.
+        :param event: The name of the event.
+        :param sort: The ``pstats`` sort key.
+        :param limit: The maximum number of functions to include.
+        """
+        stats = self.stats(namespace, event)
+        if stats is None:
+            return ''
+        stats.stream = io.StringIO()
+        stats.sort_stats(sort).print_stats(limit)
+        return stats.stream.getvalue()
+
+    def dump(self, directory):
+        """Write the aggregated profiling results of each event to a pstats
+        file in the given directory, and return the list of files written.
+
+        The files can be loaded with the :mod:`pstats` module or with other
+        tools that support this format.
+
+        :param directory: The directory where the files are written. It is
+                          created if it does not exist.
+
+        The file names are derived from the namespace and event names, with
+        a suffix that is unique for each event.
+        """
+        os.makedirs(directory, exist_ok=True)
+        filenames = []
+        with self.lock:
+            for (namespace, event), profile in self.profiles.items():
+                name = re.sub(r'[^A-Za-z0-9_.-]+', '_',
+                              f'{namespace}_{event}').strip('_')
+                # different events can have the same sanitized name
+                suffix = hashlib.sha1(repr((namespace, event)).encode(
+                    'utf-8')).hexdigest()[:8]
+                filename = os.path.join(directory, f'{name}-{suffix}.pstats')
+                profile.dump_stats(filename)
+                filenames.append(filename)
+        return filenames
+
+    def reset(self):
+        """Discard all the profiling results collected so far."""
+        with self.lock:
+            self.profiles.clear()
+            self.samples.clear()
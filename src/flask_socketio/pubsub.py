@@ -0,0 +1,428 @@
+import atexit
+import base64
+from functools import lru_cache
+import threading
+import time
+import zlib
+
+from .preserialized import unwrap
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover
+    lz4 = None
+
+# compressed payloads start with a byte that identifies the codec, so that
+# servers can decode payloads from others that use a different codec
+CODECS = {'zlib': b'z'}
+if lz4 is not None:  # pragma: no cover
+    CODECS['lz4'] = b'l'
+
+
+def compress(codec, payload):
+    """Compress a payload, prepending the header byte of the codec."""
+    if codec == 'zlib':
+        return CODECS[codec] + zlib.compress(payload)
+    elif codec == 'lz4' and lz4 is not None:  # pragma: no cover
+        return CODECS[codec] + lz4.frame.compress(payload)
+    raise ValueError(f'Unsupported compression codec: {codec}')
+
+
+def decompress(data):
+    """Decompress a payload created by :func:`compress`."""
+    header, body = data[:1], data[1:]
+    if header == CODECS['zlib']:
+        return zlib.decompress(body)
+    elif header == CODECS.get('lz4'):  # pragma: no cover
+        return lz4.frame.decompress(body)
+    raise ValueError(f'Unsupported compression header: {header!r}')
+
+
+class _EncodedMessage(dict):
+    """A queue message that carries its JSON encoding, so that it is not
+    encoded again when it is published."""
+    def __init__(self, data, encoded):
+        super().__init__(data)
+        self.encoded = encoded
+
+
+class _QueueJSON:
+    """JSON module of the message queue client managers, which reuses the
+    encoding of the messages that were encoded before they were
+    published."""
+    def __init__(self, json):
+        self.json = json
+
+    def dumps(self, obj, *args, **kwargs):
+        if isinstance(obj, _EncodedMessage):
+            return obj.encoded
+        return self.json.dumps(obj, *args, **kwargs)
+
+    def loads(self, *args, **kwargs):
+        return self.json.loads(*args, **kwargs)
+
+
+class PubSubMixin:
+    """Extensions to the message queue client managers of python-socketio.
+
+    The message queue client managers created by :class:`SocketIO` are
+    subclasses of the python-socketio manager selected by the
+    ``message_queue`` URL, with this class mixed in.
+
+    Messages are published in batches when ``batch_window`` is set. A batch
+    is published when it reaches ``batch_size`` messages, when
+    ``batch_window`` seconds have passed since its first message was added,
+    or when :meth:`flush` is called. Listening servers always accept batches,
+    regardless of this setting.
+
+    Messages that are larger than ``compression_threshold`` bytes once
+    encoded are compressed with the ``compression`` codec when it is set.
+    Listening servers always accept compressed messages, with any of the
+    codecs available to them, and announce these codecs when they start. The
+    lz4 codec is only used when all the servers that have been heard from
+    can decode it, and zlib is used otherwise.
+
+    When ``routing`` is set, each server advertises the rooms that have
+    members connected to it, and the messages that are addressed to rooms or
+    clients are published with the list of the servers that host them. Other
+    servers discard these messages without handling them, and message queues
+    that support it, such as the one implemented by
+    :class:`UnixSocketManager`, do not deliver them at all. Messages that are
+    only addressed to clients of this server are not published.
+    """
+    #: The maximum time in seconds that a message waits in a batch, or
+    #: ``None`` to publish each message on its own.
+    batch_window = None
+
+    #: The maximum number of messages in a batch.
+    batch_size = 100
+
+    #: Set to ``True`` to publish messages only to the servers that need them.
+    #: This must be enabled in all the servers that share a message queue.
+    routing = False
+
+    #: The interval in seconds at which each server advertises all its rooms.
+    #: Servers that are not heard from in three intervals are forgotten.
+    routing_interval = 30
+
+    #: The time in seconds after a server starts during which it publishes
+    #: all messages to all servers, while it learns the rooms of the others.
+    routing_warmup = 1
+
+    #: The time in seconds during which the rooms that are removed are
+    #: collected, to be advertised together.
+    routing_delay = 0.1
+
+    #: The codec used to compress large messages, ``'zlib'`` or ``'lz4'``, or
+    #: ``None`` to publish all messages uncompressed.
+    compression = None
+
+    #: The minimum size in bytes of an encoded message to compress it.
+    compression_threshold = 1024
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch = []
+        self.batch_lock = threading.Lock()
+        self.batch_timer = False
+        self.batch_atexit = False
+        self.node_rooms = {}
+        self.node_seen = {}
+        self.routing_ready = None
+        self.room_changes = {}
+        self.room_changes_lock = threading.Lock()
+        self.room_changes_timer = False
+        self.node_codecs = {}
+
+    @property
+    def json(self):
+        return self._json
+
+    @json.setter
+    def json(self, json):
+        # the JSON module is also assigned when the server is set
+        self._json = json if isinstance(json, _QueueJSON) \
+            else _QueueJSON(json)
+
+    def initialize(self):
+        super().initialize()
+        if not self.write_only:
+            self._publish_codecs(sync=True)
+        if self.routing and not self.write_only:
+            self.server.start_background_task(self._advertise_rooms)
+
+    def _publish_codecs(self, sync=False):
+        self._publish({'method': 'codecs', 'host_id': self.host_id,
+                       'codecs': sorted(CODECS), 'sync': sync})
+
+    def _handle_codecs(self, message):
+        host_id = message.get('host_id')
+        if host_id == self.host_id:
+            return
+        self.node_codecs[host_id] = set(message.get('codecs', []))
+        if message.get('sync') and not self.write_only:
+            # a server that just started needs to know our codecs
+            self._publish_codecs()
+
+    def _compression_codec(self):
+        """Return the codec to use, which falls back to zlib unless all the
+        known servers can decode the configured codec."""
+        if self.compression != 'zlib' and (not self.node_codecs or any(
+                self.compression not in codecs
+                for codecs in list(self.node_codecs.values()))):
+            return 'zlib'
+        return self.compression
+
+    def _advertise_rooms(self):
+        self.routing_ready = time.monotonic() + self.routing_warmup
+        sync = True
+        while True:
+            self._publish_rooms(add=self._local_rooms(), reset=True,
+                                sync=sync)
+            sync = False
+            self.server.sleep(self.routing_interval)
+            expired = time.monotonic() - 3 * self.routing_interval
+            for host_id, seen in list(self.node_seen.items()):
+                if seen < expired:
+                    self.node_seen.pop(host_id, None)
+                    self.node_rooms.pop(host_id, None)
+
+    def _local_rooms(self):
+        return [[namespace, room] for namespace, rooms in list(
+            self.rooms.items()) for room in list(rooms)]
+
+    def _publish_rooms(self, add=(), remove=(), reset=False, sync=False):
+        self._publish({'method': 'rooms', 'host_id': self.host_id,
+                       'add': list(add), 'remove': list(remove),
+                       'reset': reset, 'sync': sync})
+
+    def _handle_rooms(self, message):
+        host_id = message.get('host_id')
+        if host_id == self.host_id:
+            return
+        self.node_seen[host_id] = time.monotonic()
+        rooms = set() if message.get('reset') else set(
+            self.node_rooms.get(host_id, ()))
+        rooms.update(tuple(key) for key in message.get('add', []))
+        rooms.difference_update(
+            tuple(key) for key in message.get('remove', []))
+        self.node_rooms[host_id] = rooms
+        if message.get('sync') and self.routing:
+            # a server that just started needs to know our rooms
+            self._publish_rooms(add=self._local_rooms(), reset=True)
+
+    def basic_enter_room(self, sid, namespace, room, eio_sid=None):
+        new = room not in self.rooms.get(namespace, {})
+        super().basic_enter_room(sid, namespace, room, eio_sid=eio_sid)
+        if new and self.routing_ready is not None:
+            self._room_changed(namespace, room, True)
+
+    def basic_leave_room(self, sid, namespace, room):
+        existed = room in self.rooms.get(namespace, {})
+        super().basic_leave_room(sid, namespace, room)
+        if existed and self.routing_ready is not None and \
+                room not in self.rooms.get(namespace, {}):
+            self._room_changed(namespace, room, False)
+
+    def _room_changed(self, namespace, room, added):
+        with self.room_changes_lock:
+            if added:
+                # events for the room must reach this server as soon as
+                # possible, so new rooms are advertised right away, replacing
+                # a pending removal
+                self.room_changes.pop((namespace, room), None)
+                self._publish_rooms(add=[[namespace, room]])
+                return
+            # a server that keeps a room it does not host anymore only
+            # receives events that it discards, so removals are advertised
+            # in groups
+            self.room_changes[(namespace, room)] = added
+            if self.room_changes_timer:
+                return
+            self.room_changes_timer = True
+        self.server.start_background_task(self._advertise_room_changes)
+
+    def _advertise_room_changes(self):
+        self.server.sleep(self.routing_delay)
+        with self.room_changes_lock:
+            changes, self.room_changes = self.room_changes, {}
+            self.room_changes_timer = False
+            if changes:
+                # published while locked, so that it cannot be received
+                # after the advertisement of a room that is added again
+                self._publish_rooms(remove=[list(key) for key in changes])
+
+    def _route(self, data):
+        """Return the list of servers that need a message, or ``None`` if it
+        must be published to all of them.
+
+        Rooms that no other server has advertised may have been created by
+        an advertisement that has not been received yet, so messages for them
+        are published to all servers. Only the messages that are addressed to
+        clients that are connected to this server are not published.
+        """
+        if self.routing_ready is None or time.monotonic() < \
+                self.routing_ready:
+            return None
+        method = data.get('method')
+        namespace = data.get('namespace') or '/'
+        if method == 'emit':
+            room = data.get('room')
+            rooms = room if isinstance(room, (list, tuple)) else [room]
+            keys = [(namespace, room) for room in rooms]
+        elif method in ['disconnect', 'enter_room', 'leave_room']:
+            keys = [(namespace, data.get('sid'))]
+        elif method == 'close_room':
+            keys = [(namespace, data.get('room'))]
+        elif method == 'callback':
+            return [data.get('host_id')]
+        else:
+            return None
+        node_rooms = list(self.node_rooms.items())
+        nodes = set()
+        for key in keys:
+            hosts = [host_id for host_id, rooms in node_rooms if key in rooms]
+            if hosts:
+                nodes.update(hosts)
+            elif not self._is_local_client(*key):
+                return None
+        return sorted(nodes)
+
+    def _is_local_client(self, namespace, room):
+        try:
+            return room in self.rooms.get(namespace, {}).get(room, ())
+        except TypeError:
+            return False
+
+    def _publish(self, data):
+        if isinstance(data, dict) and data.get('method') == 'emit':
+            # the other servers receive the data of preserialized arguments
+            data = dict(data, data=unwrap(data.get('data') or []))
+        if self.routing and isinstance(data, dict):
+            nodes = self._route(data)
+            if nodes is not None:
+                if not nodes:
+                    # the recipients are all connected to this server
+                    return
+                data = dict(data, nodes=nodes)
+        if self.batch_window is None:
+            return self._publish_message(data)
+        with self.batch_lock:
+            self.batch.append(data)
+            if len(self.batch) >= self.batch_size:
+                messages, self.batch = self.batch, []
+            else:
+                messages = None
+                if not self.batch_timer:
+                    self.batch_timer = True
+                    self._start_flush_timer()
+                if not self.batch_atexit:
+                    # do not lose the last batch when the process exits
+                    self.batch_atexit = True
+                    atexit.register(self.flush)
+        if messages:
+            self._publish_batch(messages)
+
+    def _start_flush_timer(self):
+        if self.write_only:
+            # emitters such as Celery workers are usually not monkey patched,
+            # so the background tasks of the eventlet or gevent async modes,
+            # which are selected when these packages are installed, would
+            # not run until the process blocks on them
+            timer = threading.Timer(self.batch_window, self._flush_timer)
+            timer.daemon = True
+            timer.start()
+        else:
+            self.server.start_background_task(self._flush_later)
+
+    def _flush_later(self):
+        self.server.sleep(self.batch_window)
+        self._flush_timer()
+
+    def _flush_timer(self):
+        with self.batch_lock:
+            self.batch_timer = False
+        self.flush()
+
+    def flush(self):
+        """Publish the messages that are waiting in the current batch."""
+        with self.batch_lock:
+            messages, self.batch = self.batch, []
+        if messages:
+            self._publish_batch(messages)
+
+    def _publish_batch(self, messages):
+        if len(messages) == 1:
+            return self._publish_message(messages[0])
+        batch = {'method': 'batch', 'messages': messages}
+        if all('nodes' in message for message in messages):
+            batch['nodes'] = sorted(set().union(
+                *[message['nodes'] for message in messages]))
+        self._publish_message(batch)
+
+    def _publish_message(self, data):
+        if self.compression is not None and isinstance(data, dict):
+            payload = self.json.dumps(data)
+            if len(payload) < self.compression_threshold:
+                # the transport publishes this encoding as is
+                data = _EncodedMessage(data, payload)
+            else:
+                if isinstance(payload, str):
+                    payload = payload.encode('utf-8')
+                envelope = {'method': 'compressed', 'data': base64.b64encode(
+                    compress(self._compression_codec(), payload)).decode(
+                        'ascii')}
+                if 'nodes' in data:
+                    # routing must not require decompressing the message
+                    envelope['nodes'] = data['nodes']
+                data = envelope
+        super()._publish(data)
+
+    def _listen(self):
+        for message in super()._listen():
+            if not isinstance(message, dict):
+                try:
+                    message = self.json.loads(message)
+                except Exception:
+                    # let the base class deal with it
+                    yield message
+                    continue
+            if isinstance(message, dict) and \
+                    message.get('method') == 'compressed':
+                if not self._accept(message):
+                    continue
+                try:
+                    message = self.json.loads(decompress(base64.b64decode(
+                        message.get('data', ''))).decode('utf-8'))
+                except Exception as exc:
+                    self._get_logger().error(
+                        'Cannot decompress message queue payload: %s', exc)
+                    continue
+            if not isinstance(message, dict):
+                yield message
+            elif message.get('method') == 'batch':
+                if self._accept(message):
+                    for inner in message.get('messages', []):
+                        if self._accept(inner):
+                            yield inner
+            elif self._accept(message):
+                yield message
+
+    def _accept(self, message):
+        """Return ``True`` if a received message must be handled by this
+        server."""
+        if message.get('method') == 'rooms':
+            self._handle_rooms(message)
+            return False
+        elif message.get('method') == 'codecs':
+            self._handle_codecs(message)
+            return False
+        nodes = message.get('nodes')
+        return nodes is None or self.host_id in nodes
+
+
+@lru_cache(maxsize=None)
+def pubsub_class(manager_class):
+    """Return a subclass of a python-socketio message queue client manager
+    with :class:`PubSubMixin` mixed in."""
+    return type(manager_class.__name__, (PubSubMixin, manager_class), {})
@@ -0,0 +1,355 @@
+import logging
+import os
+import select
+import socket
+import threading
+import time
+
+import socketio
+
+default_logger = logging.getLogger('flask_socketio.unix_manager')
+
+# a connection to the hub starts with a byte that identifies its role,
+# followed by the length and the bytes of the host id of a subscriber
+PUBLISHER = b'P'
+SUBSCRIBER = b'S'
+
+
+def _path_from_url(url):
+    return url[len('unix://'):] if url.startswith('unix://') else url
+
+
+def _split_frames(buffer):
+    """Return the length of the complete frames at the start of a buffer.
+
+    Each frame is a 4-byte big-endian length followed by the body. The body
+    starts with a 2-byte big-endian length and a comma separated list of the
+    host ids of the subscribers the frame is addressed to, which is empty for
+    frames addressed to all subscribers. The rest of the body is the encoded
+    message.
+    """
+    pos = 0
+    while len(buffer) - pos >= 4:
+        size = int.from_bytes(buffer[pos:pos + 4], 'big')
+        if len(buffer) - pos - 4 < size:
+            break
+        pos += 4 + size
+    return pos
+
+
+def _iter_frames(buffer, end):
+    """Iterate over the complete frames at the start of a buffer, returning
+    each frame with the set of host ids it is addressed to, or ``None`` if it
+    is addressed to all subscribers."""
+    pos = 0
+    while pos < end:
+        size = int.from_bytes(buffer[pos:pos + 4], 'big')
+        header_size = int.from_bytes(buffer[pos + 4:pos + 6], 'big')
+        header = bytes(buffer[pos + 6:pos + 6 + header_size])
+        yield (bytes(buffer[pos:pos + 4 + size]),
+               set(header.decode().split(',')) if header else None)
+        pos += 4 + size
+
+
+def _encode_frame(payload, targets=None):
+    header = ','.join(targets).encode() if targets else b''
+    return ((len(header) + len(payload) + 2).to_bytes(4, 'big')
+            + len(header).to_bytes(2, 'big') + header + payload)
+
+
+class _HubConnection:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.outgoing = bytearray()
+        self.role = None
+        self.host_id = None
+
+    def handshake(self):
+        """Parse the handshake at the start of the buffer. Return ``True``
+        when it is complete."""
+        if len(self.buffer) < 2 or len(self.buffer) < 2 + self.buffer[1]:
+            return False
+        size = self.buffer[1]
+        self.role = bytes(self.buffer[:1])
+        self.host_id = bytes(self.buffer[2:2 + size]).decode()
+        del self.buffer[:2 + size]
+        return True
+
+
+class UnixSocketHub:
+    """Relay the messages published by the Socket.IO servers of a host to
+    all of them, over a Unix socket.
+
+    :param path: The path of the Unix socket.
+    :param logger: The logger to use. Defaults to the
+                   ``flask_socketio.unix_manager`` logger.
+    """
+    #: The maximum number of bytes waiting to be sent to a subscriber. A
+    #: subscriber that falls further behind is disconnected.
+    max_buffer_size = 16 * 1024 * 1024
+
+    def __init__(self, path, logger=None):
+        self.path = path
+        self.logger = logger or default_logger
+        self.listener = None
+        self.lock_file = None
+        self.running = False
+
+    def bind(self):
+        """Create the Unix socket, replacing a stale one left behind by a
+        previous hub.
+
+        A lock on a file next to the socket ensures that only one hub runs
+        for a given path. ``BlockingIOError`` is raised if another hub holds
+        the lock.
+        """
+        import fcntl  # not available on Windows
+
+        lock_file = open(self.path + '.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise
+        self.lock_file = lock_file
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(128)
+        self.logger.info('Local message queue listening on %s', self.path)
+
+    def serve_forever(self):
+        """Relay messages until :meth:`stop` is called."""
+        if self.listener is None:
+            self.bind()
+        connections = {}
+        self.running = True
+        while self.running:
+            # the sockets do not block, so that a subscriber that does not
+            # read its messages cannot stall the other connections
+            readable, writable, _ = select.select(
+                [self.listener, *connections],
+                [sock for sock, connection in connections.items()
+                 if connection.outgoing], [], 0.5)
+            for sock in writable:
+                self._send(sock, connections)
+            for sock in readable:
+                if sock is self.listener:
+                    conn, _ = sock.accept()
+                    conn.setblocking(False)
+                    connections[conn] = _HubConnection()
+                    continue
+                if sock not in connections:
+                    continue  # closed while sending
+                try:
+                    data = sock.recv(65536)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b''
+                if not data:
+                    self._close(sock, connections)
+                    continue
+                connection = connections[sock]
+                connection.buffer += data
+                if connection.role is None and not connection.handshake():
+                    continue
+                end = _split_frames(connection.buffer)
+                if not end:
+                    continue
+                subscribers = set()
+                for frame, targets in _iter_frames(connection.buffer, end):
+                    for subscriber, other in connections.items():
+                        if other.role == SUBSCRIBER and (
+                                targets is None or other.host_id in targets):
+                            other.outgoing += frame
+                            subscribers.add(subscriber)
+                del connection.buffer[:end]
+                for subscriber in subscribers:
+                    self._send(subscriber, connections)
+        for sock in list(connections):
+            self._close(sock, connections)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.close()
+
+    def close(self):
+        """Close the Unix socket and release the lock, without removing the
+        socket file. A forked process that runs the hub keeps its own copies
+        of both."""
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def _send(self, sock, connections):
+        """Send as much of the outgoing buffer of a connection as its
+        socket accepts without blocking."""
+        connection = connections[sock]
+        try:
+            sent = sock.send(connection.outgoing)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._close(sock, connections)
+            return
+        del connection.outgoing[:sent]
+        if len(connection.outgoing) > self.max_buffer_size:
+            self.logger.error('Disconnecting a subscriber of the local '
+                              'message queue that is not reading its '
+                              'messages')
+            self._close(sock, connections)
+
+    def _close(self, sock, connections):
+        sock.close()
+        connections.pop(sock, None)
+
+    def stop(self):
+        """Stop relaying messages."""
+        self.running = False
+
+
+class UnixSocketManager(socketio.PubSubManager):
+    """Client manager that uses a :class:`UnixSocketHub` as a message queue,
+    to connect the Socket.IO servers that run on a single host.
+
+    This client manager is selected with a ``unix://`` message queue URL,
+    followed by the path of the Unix socket. There is no broker to install:
+    the first server that finds no hub listening on the socket starts one in
+    a background task, and if that server exits, another one takes over.
+
+    :param url: The path of the Unix socket of the hub, optionally with a
+                ``unix://`` prefix.
+    :param channel: The channel name on which the server sends and receives
+                    notifications.
+    :param write_only: If set to ``True``, only initialize to emit events.
+    :param logger: a custom logger to use.
+    :param json: An alternative JSON module to use for encoding and decoding
+                 packets.
+    """
+    name = 'unix'
+
+    def __init__(self, url='unix:///tmp/flask-socketio.sock',
+                 channel='socketio', write_only=False, logger=None,
+                 json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger,
+                         json=json)
+        self.path = _path_from_url(url)
+        self.sock = None
+        self.listen_sock = None
+        self.lock = threading.Lock()
+        self.hub = None
+        self.stopped = False
+
+    def _start_hub(self):
+        """Start a hub in this process, unless another process runs one.
+        Return ``True`` if the hub was started."""
+        hub = UnixSocketHub(self.path, logger=self._get_logger())
+        try:
+            hub.bind()
+        except OSError:
+            return False
+        self.hub = hub
+        self.server.start_background_task(hub.serve_forever)
+        return True
+
+    def _connect(self, role):
+        host_id = self.host_id.encode() if role == SUBSCRIBER else b''
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+            sock.sendall(role + bytes([len(host_id)]) + host_id)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _publish(self, data):
+        # the message is encoded on its own, as it may carry its encoding
+        parts = [self.json.dumps(self.channel), self.json.dumps(data)]
+        payload = b'[' + b','.join(
+            part.encode('utf-8') if isinstance(part, str) else part
+            for part in parts) + b']'
+        # the hub only forwards routed messages to the listed hosts
+        frame = _encode_frame(payload, data.get('nodes')
+                              if isinstance(data, dict) else None)
+        with self.lock:
+            for retries_left in range(1, -1, -1):  # 2 attempts
+                try:
+                    if self.sock is None:
+                        self.sock = self._connect(PUBLISHER)
+                    self.sock.sendall(frame)
+                    return
+                except OSError:
+                    if self.sock is not None:
+                        self.sock.close()
+                        self.sock = None
+                    if retries_left == 0:
+                        self._get_logger().error(
+                            'Cannot publish to the local message queue... '
+                            'giving up')
+
+    def stop(self):
+        """Stop listening for messages and close the connections to the
+        hub. The hub is also stopped if this manager started it."""
+        self.stopped = True
+        listen_sock = self.listen_sock
+        if listen_sock is not None:
+            try:
+                # wake up the listening task, which closes the socket
+                listen_sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        with self.lock:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+        if self.hub is not None:
+            self.hub.stop()
+
+    def _listen(self):
+        while not self.stopped:
+            try:
+                sock = self._connect(SUBSCRIBER)
+            except OSError:
+                if self.stopped:
+                    break
+                if self.hub is None and self._start_hub():
+                    continue
+                self._get_logger().error('Cannot connect to the local message '
+                                         'queue, retrying in 1 second')
+                time.sleep(1)
+                continue
+            self.listen_sock = sock
+            buffer = bytearray()
+            try:
+                while not self.stopped:
+                    data = sock.recv(65536)
+                    if not data:
+                        break
+                    buffer += data
+                    end = _split_frames(buffer)
+                    pos = 0
+                    while pos < end:
+                        size = int.from_bytes(buffer[pos:pos + 4], 'big')
+                        header_size = int.from_bytes(
+                            buffer[pos + 4:pos + 6], 'big')
+                        channel, message = self.json.loads(
+                            buffer[pos + 6 + header_size:pos + 4 + size]
+                            .decode('utf-8'))
+                        pos += 4 + size
+                        if channel == self.channel:
+                            yield message
+                    del buffer[:end]
+            except OSError:
+                pass
+            finally:
+                self.listen_sock = None
+                sock.close()
+            if self.stopped:
+                break
+            self._get_logger().error('Lost the connection to the local '
+                                     'message queue, reconnecting')
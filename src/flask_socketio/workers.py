@@ -0,0 +1,119 @@
+import logging
+import os
+import signal
+import time
+import traceback
+
+from .unix_manager import UnixSocketHub
+
+default_logger = logging.getLogger('flask_socketio.workers')
+
+
+def _exit_code(status):
+    """Return the exit code of a process from its wait status, or the
+    negated signal number if it was killed by a signal, as
+    ``os.waitstatus_to_exitcode()`` does in Python 3.9 and newer."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class Supervisor:
+    """Run a server in several worker processes, and restart the workers
+    that exit.
+
+    The workers are forked from the calling process, so they inherit any
+    listening socket created before :meth:`run` is called. When a queue path
+    is given, a :class:`UnixSocketHub` also runs in its own process, so that
+    the workers can use it as their message queue.
+
+    :param workers: The number of worker processes.
+    :param target: The function that runs the server in a worker process.
+    :param queue_path: The path of the Unix socket of the message queue hub,
+                       or ``None`` to not start a hub.
+    :param restart_delay: A worker that exits within this number of seconds
+                          of being started is restarted after this delay, to
+                          avoid a tight restart loop when the worker fails
+                          during startup.
+    :param logger: The logger to use. Defaults to the
+                   ``flask_socketio.workers`` logger.
+    """
+    def __init__(self, workers, target, queue_path=None, restart_delay=1,
+                 logger=None):
+        self.workers = workers
+        self.target = target
+        self.queue_path = queue_path
+        self.restart_delay = restart_delay
+        self.logger = logger or default_logger
+        self.children = {}
+        self.running = False
+
+    def run(self):
+        """Start the worker processes and supervise them until the process
+        receives ``SIGINT`` or ``SIGTERM``."""
+        self.running = True
+        previous_handlers = {sig: signal.signal(sig, self._stop)
+                             for sig in [signal.SIGINT, signal.SIGTERM]}
+        try:
+            if self.queue_path is not None:
+                self._start_hub()
+            for index in range(self.workers):
+                self._spawn(index, self.target)
+            while self.children:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:  # pragma: no cover
+                    break
+                name, started = self.children.pop(pid, (None, None))
+                if name is None or not self.running:
+                    continue
+                self.logger.warning('%s exited with status %d, restarting',
+                                    'Message queue hub' if name == 'hub'
+                                    else f'Worker {name}',
+                                    _exit_code(status))
+                if time.monotonic() - started < self.restart_delay:
+                    time.sleep(self.restart_delay)
+                if name == 'hub':
+                    self._start_hub()
+                else:
+                    self._spawn(name, self.target)
+        finally:
+            for sig, handler in previous_handlers.items():
+                signal.signal(sig, handler)
+
+    def _start_hub(self):
+        hub = UnixSocketHub(self.queue_path, logger=self.logger)
+        # the socket is created before the workers start, so that they can
+        # connect to it right away
+        try:
+            hub.bind()
+        except OSError:  # pragma: no cover
+            # a worker took over while the hub was down
+            self.logger.info('The message queue hub is running in a worker')
+            return
+        self._spawn('hub', hub.serve_forever)
+        hub.close()
+
+    def _spawn(self, name, func):
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            exit_code = 0
+            try:
+                func()
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        self.children[pid] = (name, time.monotonic())
+        return pid
+
+    def _stop(self, signum, frame):
+        self.running = False
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:  # pragma: no cover
+                pass
@@ -1,10 +1,27 @@
+import asyncio
 import json
+import os
+import pstats
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
 import time
 import unittest
 
+import socketio as python_socketio
+
 from flask import Flask, session, request, json as flask_json
+from flask.sessions import SessionInterface, SessionMixin
 from flask_socketio import SocketIO, send, emit, join_room, leave_room, \
-    Namespace, disconnect, ConnectionRefusedError
+    Namespace, disconnect, ConnectionRefusedError, HandlerExecutor, \
+    LagMonitor, Preserialized, slow_event, _ManagedSession
+from flask_socketio.pubsub import CODECS, pubsub_class
+from flask_socketio.unix_manager import UnixSocketHub, UnixSocketManager, \
+    _encode_frame
+from flask_socketio.workers import Supervisor
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret'
@@ -284,6 +301,10 @@ def session_route():
     return ''
 
 
+def square_with_pid(x):
+    return x * x, os.getpid()
+
+
 class TestSocketIO(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -370,6 +391,48 @@ class TestSocketIO(unittest.TestCase):
         client.disconnect('/test')
         self.assertEqual(disconnected, '/test')
 
+    def test_disconnect_handler_type_error(self):
+        app = Flask(__name__)
+        socketio = SocketIO(app)
+        calls = []
+
+        @socketio.on('connect')
+        def on_connect(auth):
+            calls.append('connect')
+            if auth == 'fail':
+                raise TypeError('connect error')
+
+        @socketio.on('disconnect')
+        def on_disconnect(reason):
+            calls.append('disconnect')
+            raise TypeError('handler error')
+
+        class LegacyNamespace(Namespace):
+            def on_disconnect(self):
+                calls.append('legacy')
+                raise TypeError('legacy error')
+
+        socketio.on_namespace(LegacyNamespace('/legacy'))
+
+        client = socketio.test_client(app)
+        with self.assertRaises(TypeError) as cm:
+            client.disconnect()
+        self.assertEqual(str(cm.exception), 'handler error')
+        # the handlers are not invoked again after raising TypeError
+        self.assertEqual(calls, ['connect', 'disconnect'])
+
+        client = socketio.test_client(app, namespace='/legacy')
+        with self.assertRaises(TypeError) as cm:
+            client.disconnect('/legacy')
+        self.assertEqual(str(cm.exception), 'legacy error')
+        self.assertEqual(calls.count('legacy'), 1)
+
+        del calls[:]
+        with self.assertRaises(TypeError) as cm:
+            socketio.test_client(app, auth='fail')
+        self.assertEqual(str(cm.exception), 'connect error')
+        self.assertEqual(calls, ['connect'])
+
     def test_message_queue_options(self):
         app = Flask(__name__)
         socketio = SocketIO(app, message_queue='redis://')
@@ -538,6 +601,66 @@ class TestSocketIO(unittest.TestCase):
             socketio.server.environ[client.eio_sid]['saved_session'],
             {'a': 'c', 'foo': 'bar'})
 
+    def test_lazy_managed_session(self):
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'secret'
+        socketio = SocketIO(app)
+        opened = []
+        open_session = app.session_interface.open_session
+
+        def counting_open_session(app, request):
+            opened.append(open_session(app, request))
+            return opened[-1]
+
+        app.session_interface.open_session = counting_open_session
+
+        @app.route('/session')
+        def session_route():
+            session['foo'] = 'bar'
+            return ''
+
+        @socketio.on('noop')
+        def on_noop():
+            return 'ok'
+
+        @socketio.on('get')
+        def on_get():
+            return session.get('foo')
+
+        @socketio.on('set')
+        def on_set():
+            session['foo'] = 'baz'
+
+        @socketio.on('dump')
+        def on_dump():
+            emit('session', session._get_current_object())
+            return isinstance(session, dict), json.dumps(
+                session._get_current_object())
+
+        flask_client = app.test_client()
+        flask_client.get('/session')
+        del opened[:]
+        client = socketio.test_client(app, flask_test_client=flask_client)
+        self.assertEqual(client.emit('noop', callback=True), 'ok')
+        saved_session = socketio.server.environ[client.eio_sid][
+            'saved_session']
+        self.assertFalse(saved_session.loaded)
+        self.assertEqual(opened, [])
+        self.assertEqual(client.emit('get', callback=True), 'bar')
+        self.assertEqual(client.emit('get', callback=True), 'bar')
+        self.assertTrue(saved_session.loaded)
+        self.assertEqual(len(opened), 1)
+        client.emit('set')
+        self.assertEqual(client.emit('get', callback=True), 'baz')
+        self.assertEqual(opened[0]['foo'], 'bar')
+        self.assertEqual(len(opened), 1)
+
+        client2 = socketio.test_client(app, flask_test_client=flask_client)
+        self.assertEqual(client2.emit('dump', callback=True),
+                         [True, '{"foo": "bar"}'])
+        self.assertEqual(client2.get_received()[0]['args'][0],
+                         {'foo': 'bar'})
+
     def test_unmanaged_session(self):
         socketio.manage_session = False
         flask_client = app.test_client()
@@ -549,6 +672,66 @@ class TestSocketIO(unittest.TestCase):
         client.send('test session')
         socketio.manage_session = True
 
+    def test_unmanaged_session_changes(self):
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'secret'
+        socketio = SocketIO(app, manage_session=False)
+        saved = []
+
+        class Session(dict, SessionMixin):
+            sid = 'abc'
+
+            def describe(self):
+                return f'{self.sid}: {self["foo"]}'
+
+        class TestSessionInterface(SessionInterface):
+            def open_session(self, app, request):
+                return Session(foo='bar', items=[])
+
+            def save_session(self, app, session, response):
+                saved.append(session)
+
+        app.session_interface = TestSessionInterface()
+
+        @socketio.on('get')
+        def on_get():
+            return session['foo']
+
+        @socketio.on('backend')
+        def on_backend():
+            return isinstance(session, Session), session.sid, \
+                session.describe()
+
+        @socketio.on('set')
+        def on_set(value):
+            session['foo'] = value
+            session.pop('missing', None)
+
+        @socketio.on('append')
+        def on_append(value):
+            session['items'].append(value)
+            session.modified = True
+
+        client = socketio.test_client(app)
+        self.assertEqual(client.emit('get', callback=True), 'bar')
+        self.assertEqual(client.emit('backend', callback=True),
+                         [True, 'abc', 'abc: bar'])
+        self.assertEqual(saved, [])
+        client.emit('set', 'baz')
+        self.assertEqual(saved, [{'foo': 'baz', 'items': []}])
+        client.emit('append', 'a')
+        self.assertEqual(saved[1], {'foo': 'bar', 'items': ['a']})
+        self.assertIsInstance(saved[1], Session)
+
+        def save_session_changes(app, session, response, keys):
+            saved.append(keys)
+
+        app.session_interface.save_session_changes = save_session_changes
+        client.emit('get')
+        client.emit('set', 'baz')
+        client.emit('append', 'a')
+        self.assertEqual(saved[2:], [{'foo'}, set()])
+
     def test_room(self):
         client1 = socketio.test_client(app, auth={'foo': 'bar'})
         client2 = socketio.test_client(app, auth={'foo': 'bar'})
@@ -759,6 +942,50 @@ class TestSocketIO(unittest.TestCase):
         expected_data = {'message': 'other_custom_event', 'args': ('foo',)}
         self.assertEqual(request_event_data, expected_data)
 
+    def test_dispatch_table_class_based(self):
+        app = Flask(__name__)
+        socketio = SocketIO(app)
+
+        class DispatchNamespace(Namespace):
+            def on_foo(self, data):
+                emit('foo response', data)
+
+        socketio.on_namespace(DispatchNamespace('/dispatch'))
+        client = socketio.test_client(app, namespace='/dispatch')
+        client.emit('foo', 'a', namespace='/dispatch')
+        client.emit('bar', 'b', namespace='/dispatch')
+        received = client.get_received('/dispatch')
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0]['name'], 'foo response')
+
+        def on_catch_all(self, event, data):
+            emit('catch all response', (event, data))
+
+        DispatchNamespace.on_catch_all = on_catch_all
+        client.emit('foo', 'a', namespace='/dispatch')
+        client.emit('bar', 'b', namespace='/dispatch')
+        received = client.get_received('/dispatch')
+        self.assertEqual(len(received), 2)
+        self.assertEqual(received[1]['name'], 'catch all response')
+        self.assertEqual(received[1]['args'], ['bar', 'b'])
+        client.emit('*', 'c', namespace='/dispatch')
+        received = client.get_received('/dispatch')
+        self.assertEqual(received[0]['args'], ['*', 'c'])
+        client.emit('catch_all', 'd', namespace='/dispatch')
+        received = client.get_received('/dispatch')
+        self.assertEqual(received[0]['args'], ['catch_all', 'd'])
+
+        ns = socketio.server.namespace_handlers['/dispatch']
+        ns.on_bar = lambda data: emit('bar response', data)
+        client.emit('bar', 'b', namespace='/dispatch')
+        received = client.get_received('/dispatch')
+        self.assertEqual(received[0]['name'], 'bar response')
+
+        del DispatchNamespace.on_catch_all
+        del ns.on_bar
+        client.emit('bar', 'b', namespace='/dispatch')
+        self.assertEqual(client.get_received('/dispatch'), [])
+
     def test_delayed_init(self):
         app = Flask(__name__)
         socketio = SocketIO(allow_upgrades=False, json=flask_json)
@@ -776,6 +1003,1027 @@ class TestSocketIO(unittest.TestCase):
         self.assertEqual(len(received), 1)
         self.assertEqual(received[0]['args'], {'connected': 'foo'})
 
+    def test_light_context(self):
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'secret'
+        socketio = SocketIO(app, light_context=True)
+        requests = []
+
+        @socketio.on('light')
+        def on_light(data):
+            requests.append(request._get_current_object())
+            session['count'] = session.get('count', 0) + 1
+            emit('light response', {'sid': request.sid,
+                                    'count': session['count'],
+                                    'data': data})
+
+        client = socketio.test_client(app)
+        client.emit('light', 'foo')
+        client.emit('light', 'bar')
+        received = client.get_received()
+        self.assertEqual(len(received), 2)
+        self.assertEqual(received[0]['args'][0]['count'], 1)
+        self.assertEqual(received[1]['args'][0]['count'], 2)
+        self.assertEqual(received[1]['args'][0]['data'], 'bar')
+        self.assertEqual(received[0]['args'][0]['sid'],
+                         received[1]['args'][0]['sid'])
+        self.assertIs(requests[0], requests[1])
+
+        client2 = socketio.test_client(app)
+        client2.emit('light', 'baz')
+        received = client2.get_received()
+        self.assertEqual(received[0]['args'][0]['count'], 1)
+        self.assertIsNot(requests[2], requests[0])
+
+    def test_session_injector(self):
+        self.assertIsNotNone(socketio.session_injector)
+        with app.test_request_context() as ctx:
+            session_obj = _ManagedSession({'foo': 'bar'})
+            socketio.session_injector.inject(ctx, session_obj)
+            self.assertIs(session._get_current_object(), session_obj)
+
+    def test_handler_type_error(self):
+        app = Flask(__name__)
+        socketio = SocketIO(app)
+        calls = []
+
+        @socketio.on('connect')
+        def on_connect():
+            calls.append('connect')
+            if len(calls) == 1:
+                raise TypeError('connect error')
+
+        @socketio.on('disconnect')
+        def on_disconnect():
+            calls.append('disconnect')
+            raise TypeError('disconnect error')
+
+        class TypeErrorNamespace(Namespace):
+            def on_disconnect(self, reason):
+                calls.append(reason)
+                raise TypeError('disconnect error')
+
+        socketio.on_namespace(TypeErrorNamespace('/ns'))
+
+        with self.assertRaises(TypeError):
+            socketio.test_client(app)
+        self.assertEqual(calls, ['connect'])
+        client = socketio.test_client(app)
+        client.connect('/ns')
+        with self.assertRaises(TypeError):
+            client.disconnect()
+        self.assertEqual(calls, ['connect', 'connect', 'disconnect'])
+        with self.assertRaises(TypeError):
+            client.disconnect('/ns')
+        self.assertEqual(calls, ['connect', 'connect', 'disconnect',
+                                 'client disconnect'])
+
+    def test_middleware_environ(self):
+        app = Flask(__name__)
+        socketio = SocketIO(app)
+        environs = []
+
+        def wsgi_app(environ, start_response):
+            environs.append(environ)
+            return []
+
+        def start_response(status, headers):
+            pass
+
+        socketio.sockio_mw.wsgi_app = wsgi_app
+        environ = {'PATH_INFO': '/route', 'QUERY_STRING': ''}
+        socketio.sockio_mw(environ, start_response)
+        self.assertIs(environs[0], environ)
+        self.assertNotIn('flask.app', environ)
+
+        socketio.server.handle_request = lambda environ, start_response: \
+            environs.append(environ)
+        environ = {'PATH_INFO': '/socket.io/',
+                   'QUERY_STRING': 'EIO=4&transport=polling'}
+        socketio.sockio_mw(environ, start_response)
+        self.assertIsNot(environs[1], environ)
+        self.assertIs(environs[1]['flask.app'], app)
+        self.assertNotIn('flask.app', environ)
+
+        environ = {'PATH_INFO': '/socket.io/',
+                   'QUERY_STRING': 'EIO=4&transport=polling&sid=123'}
+        socketio.sockio_mw(environ, start_response)
+        self.assertIs(environs[2], environ)
+        self.assertIs(environ['flask.app'], app)
+
+        # only a sid argument identifies an established connection
+        environ = {'PATH_INFO': '/socket.io/',
+                   'QUERY_STRING': 'EIO=4&transport=polling&usersid=1'}
+        socketio.sockio_mw(environ, start_response)
+        self.assertIsNot(environs[3], environ)
+        self.assertNotIn('flask.app', environ)
+
+    def test_retain_environ(self):
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'secret'
+        socketio = SocketIO(app, retain_environ=['HTTP_X_KEEP'])
+        headers = {}
+
+        @socketio.on('connect')
+        def on_connect():
+            session['foo'] = 'bar'
+            headers['connect'] = dict(request.headers)
+
+        @socketio.on('headers')
+        def on_headers():
+            headers['event'] = dict(request.headers)
+            return session['foo'], request.args['a']
+
+        client = socketio.test_client(app, query_string='a=1',
+                                      headers={'X-Keep': 'yes',
+                                               'X-Drop': 'no'})
+        self.assertEqual(client.emit('headers', callback=True),
+                         ['bar', '1'])
+        self.assertEqual(headers['connect']['X-Keep'], 'yes')
+        self.assertEqual(headers['connect']['X-Drop'], 'no')
+        self.assertEqual(headers['event']['X-Keep'], 'yes')
+        self.assertNotIn('X-Drop', headers['event'])
+        environ = socketio.server.environ[client.eio_sid]
+        self.assertNotIn('HTTP_X_DROP', environ)
+        self.assertEqual(environ['wsgi.input'].read(), b'')
+        self.assertNotIn('werkzeug.request', environ)
+
+    def test_metrics(self):
+        app = Flask(__name__)
+        socketio = SocketIO(app, metrics=True)
+        socketio.metrics.mount(app)
+
+        @socketio.on('echo')
+        def on_echo(data):
+            emit('echo response', data, broadcast=True)
+
+        @socketio.on('fail', namespace='/test')
+        def on_fail():
+            raise RuntimeError('fail')
+
+        @socketio.on_error('/test')
+        def on_error(e):
+            pass
+
+        client1 = socketio.test_client(app)
+        client2 = socketio.test_client(app)
+        client2.connect('/test')
+        client1.emit('echo', 'foo')
+        client1.emit('echo', 'bar')
+        client2.emit('fail', namespace='/test')
+        snapshot = socketio.metrics.snapshot()
+        self.assertEqual(snapshot['connections'], {'/': 2, '/test': 1})
+        echo = snapshot['events'][('/', 'echo')]
+        self.assertEqual(echo['count'], 2)
+        self.assertEqual(echo['errors'], 0)
+        self.assertEqual(echo['latency']['buckets'][float('inf')], 2)
+        self.assertEqual(snapshot['events'][('/test', 'fail')]['errors'], 1)
+        fanout = snapshot['emits'][('/', 'echo response')]
+        self.assertEqual(fanout['count'], 2)
+        self.assertEqual(fanout['sum'], 4)
+        self.assertEqual(fanout['buckets'][1], 0)
+        self.assertEqual(fanout['buckets'][2], 2)
+
+        response = app.test_client().get('/metrics')
+        self.assertEqual(response.mimetype, 'text/plain')
+        text = response.get_data(as_text=True)
+        self.assertIn('flask_socketio_events_total{namespace="/",'
+                      'event="echo"} 2\n', text)
+        self.assertIn('flask_socketio_event_errors_total{namespace="/test",'
+                      'event="fail"} 1\n', text)
+        self.assertIn('flask_socketio_handler_duration_seconds_count{'
+                      'namespace="/",event="echo"} 2\n', text)
+        self.assertIn('flask_socketio_emit_recipients_bucket{namespace="/",'
+                      'event="echo response",le="+Inf"} 2\n', text)
+        self.assertIn('flask_socketio_connections{namespace="/"} 2\n', text)
+
+    def test_profiler(self):
+        app = Flask(__name__)
+        socketio = SocketIO(app, profiler=1)
+
+        def work(n):
+            return sum(range(n))
+
+        @socketio.on('work', namespace='/test')
+        def on_work(n):
+            return work(n)
+
+        client = socketio.test_client(app, namespace='/test')
+        self.assertEqual(client.emit('work', 10, namespace='/test',
+                                     callback=True), 45)
+        client.emit('work', 10, namespace='/test')
+        self.assertEqual(socketio.profiler.events(), {('/test', 'work'): 2})
+        stats = socketio.profiler.stats('/test', 'work')
+        calls = {func[2]: stat[0] for func, stat in stats.stats.items()}
+        self.assertEqual(calls['work'], 2)
+        self.assertIn('work', socketio.profiler.report('/test', 'work'))
+        self.assertIsNone(socketio.profiler.stats('/', 'work'))
+        self.assertEqual(socketio.profiler.report('/', 'work'), '')
+
+        # a profiled handler does not block access to the results
+        started = threading.Event()
+        finish = threading.Event()
+
+        def slow():
+            started.set()
+            finish.wait(5)
+
+        thread = threading.Thread(
+            target=socketio.profiler.wrap(slow, '/a', 'b_c'))
+        thread.start()
+        started.wait(5)
+        self.assertEqual(socketio.profiler.events(), {('/test', 'work'): 2})
+        finish.set()
+        thread.join()
+        socketio.profiler.wrap(lambda: None, '/a_b', 'c')()
+
+        with tempfile.TemporaryDirectory() as directory:
+            filenames = socketio.profiler.dump(directory)
+            self.assertEqual(len(set(filenames)), 3)
+            self.assertTrue(os.path.basename(filenames[0]).startswith(
+                'test_work-'))
+            self.assertEqual(len(os.listdir(directory)), 3)
+            stats = pstats.Stats(filenames[0])
+            self.assertIn('work', [func[2] for func in stats.stats])
+
+        socketio.profiler.reset()
+        self.assertEqual(socketio.profiler.events(), {})
+        socketio.profiler.sample_rate = 0
+        client.emit('work', 10, namespace='/test')
+        self.assertEqual(socketio.profiler.events(), {})
+
+    def test_time_budget(self):
+        app = Flask(__name__)
+        socketio = SocketIO(app, time_budget=0.5)
+        slow_events = []
+
+        def on_slow_event(sender, **kwargs):
+            slow_events.append((sender, kwargs))
+
+        @socketio.on('sleep', time_budget=0.001)
+        def on_sleep(seconds):
+            time.sleep(seconds)
+
+        @socketio.on('fast')
+        def on_fast():
+            time.sleep(0.002)
+
+        class SleepNamespace(Namespace):
+            time_budgets = {'sleep': 0.001}
+
+            def on_sleep(self, seconds):
+                time.sleep(seconds)
+
+        socketio.on_namespace(SleepNamespace('/ns'))
+        client = socketio.test_client(app)
+        client.connect('/ns')
+        with slow_event.connected_to(on_slow_event):
+            with self.assertLogs(app.logger, 'WARNING') as logs:
+                client.emit('sleep', 0.01)
+                client.emit('fast')
+                client.emit('sleep', 0.01, namespace='/ns')
+        self.assertEqual(len(slow_events), 2)
+        sender, kwargs = slow_events[0]
+        self.assertIs(sender, socketio)
+        self.assertEqual(kwargs['namespace'], '/')
+        self.assertEqual(kwargs['event'], 'sleep')
+        self.assertEqual(kwargs['sid'], socketio.server.manager.
+                         sid_from_eio_sid(client.eio_sid, '/'))
+        self.assertEqual(kwargs['time_budget'], 0.001)
+        self.assertGreaterEqual(kwargs['elapsed'], 0.01)
+        self.assertEqual(slow_events[1][1]['namespace'], '/ns')
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('Handler for event "sleep" on namespace "/"',
+                      logs.output[0])
+
+    def test_lag_monitor(self):
+        app = Flask(__name__)
+        monitor = LagMonitor(interval=0.001, threshold=0.05,
+                             dump_stacks=True)
+        socketio = SocketIO(app, metrics=True, lag_monitor=monitor)
+        self.assertIs(socketio.lag_monitor, monitor)
+        for _ in range(100):
+            if socketio.metrics.snapshot()['loop_lag']['count']:
+                break
+            time.sleep(0.01)
+        monitor.stop()
+        self.assertGreater(socketio.metrics.snapshot()['loop_lag']['count'],
+                           0)
+
+        with self.assertLogs('flask_socketio.monitor', 'WARNING') as logs:
+            monitor.record(0.2)
+        self.assertEqual(monitor.last_lag, 0.2)
+        self.assertEqual(monitor.max_lag, 0.2)
+        self.assertIn('blocked for 0.200 seconds', logs.output[0])
+        self.assertIn('flask_socketio_loop_lag_seconds_count',
+                      socketio.metrics.prometheus())
+
+        # simulate a blocked loop in this thread
+        monitor = LagMonitor(interval=0.001, threshold=0.05)
+        monitor.socketio = socketio
+        monitor.running = True
+        monitor.loop_thread_id = threading.get_ident()
+        monitor.heartbeat = time.monotonic() - 1
+        with self.assertLogs('flask_socketio.monitor', 'WARNING') as logs:
+            watchdog = threading.Thread(target=monitor._watchdog)
+            watchdog.start()
+            time.sleep(0.2)
+            monitor.stop()
+            watchdog.join()
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('test_lag_monitor', logs.output[0])
+
+    def test_executor(self):
+        app = Flask(__name__)
+        socketio = SocketIO(app, async_mode='threading', metrics=True,
+                            executor={'max_workers': 2, 'queue_size': 1,
+                                      'rejection_policy': 'drop'})
+        executor = socketio.server.executor
+        release = threading.Event()
+        handled = []
+
+        @socketio.on('block')
+        def on_block(value):
+            release.wait()
+            handled.append(value)
+
+        client = socketio.test_client(app)
+        socketio.server.async_handlers = True
+        with self.assertLogs('flask_socketio.executor', 'WARNING'):
+            for i in range(4):
+                socketio.server._handle_event(client.eio_sid, '/', None,
+                                              ['block', i])
+        for _ in range(100):
+            if executor.stats()['active'] == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(executor.stats(), {
+            'max_workers': 2, 'queue_size': 1, 'active': 2, 'queued': 1,
+            'completed': 0, 'rejected': 1})
+        text = socketio.metrics.prometheus()
+        self.assertIn('flask_socketio_executor_active 2\n', text)
+        self.assertIn('flask_socketio_executor_queue_depth 1\n', text)
+        self.assertIn('flask_socketio_executor_rejected_total 1\n', text)
+        release.set()
+        executor.shutdown()
+        self.assertEqual(sorted(handled), [0, 1, 2])
+        self.assertEqual(executor.stats()['completed'], 3)
+
+        executor = HandlerExecutor(max_workers=1, queue_size=0,
+                                   rejection_policy='caller_runs')
+        release.clear()
+        executor.submit(release.wait)
+        executor.submit(handled.append, threading.get_ident())
+        self.assertEqual(handled[-1], threading.get_ident())
+        release.set()
+        executor.shutdown()
+        self.assertRaises(ValueError, HandlerExecutor,
+                          rejection_policy='foo')
+
+    def test_executor_ordered(self):
+        app = Flask(__name__)
+        socketio = SocketIO(app, async_mode='threading',
+                            executor={'max_workers': 4, 'ordered': True})
+        executor = socketio.server.executor
+        handled = []
+        lock = threading.Lock()
+
+        @socketio.on('work')
+        def on_work(value):
+            time.sleep(0.001)
+            with lock:
+                handled.append((request.sid, value, threading.get_ident()))
+
+        clients = [socketio.test_client(app) for _ in range(4)]
+        socketio.server.async_handlers = True
+        for i in range(20):
+            for client in clients:
+                socketio.server._handle_event(client.eio_sid, '/', None,
+                                              ['work', i])
+        executor.shutdown()
+        self.assertEqual(len(handled), 80)
+        self.assertEqual(executor.queues, {})
+        for client in clients:
+            sid = socketio.server.manager.sid_from_eio_sid(client.eio_sid,
+                                                           '/')
+            self.assertEqual([value for s, value, _ in handled if s == sid],
+                             list(range(20)))
+        self.assertGreater(len({ident for _, _, ident in handled}), 1)
+        self.assertRaises(ValueError, HandlerExecutor, ordered=True,
+                          rejection_policy='caller_runs')
+
+    def test_process_executor(self):
+        app = Flask(__name__)
+        socketio = SocketIO(app, process_pool=1)
+        socketio.on('square', executor='process')(square_with_pid)
+
+        @socketio.on('square in handler')
+        def on_square_in_handler(x):
+            emit('square', socketio.run_in_process(square_with_pid, x)[0])
+
+        client = socketio.test_client(app)
+        try:
+            value, pid = client.emit('square', 7, callback=True)
+            self.assertEqual(value, 49)
+            self.assertNotEqual(pid, os.getpid())
+            client.emit('square in handler', 3)
+            self.assertEqual(client.get_received()[0]['args'], [9])
+        finally:
+            socketio.process_pool.shutdown()
+        self.assertRaises(ValueError, socketio.on, 'foo', executor='foo')
+        self.assertRaises(ValueError, socketio.on, 'connect',
+                          executor='process')
+
+    def test_async_handlers(self):
+        app = Flask(__name__)
+        socketio = SocketIO(app)
+        loops = []
+
+        @socketio.on('connect')
+        async def on_connect(auth):
+            if auth != 'secret':
+                return False
+            loops.append(asyncio.get_running_loop())
+
+        @socketio.on('gather')
+        async def on_gather(values):
+            async def double(value):
+                await asyncio.sleep(0.01)
+                return value * 2
+
+            loops.append(asyncio.get_running_loop())
+            results = await asyncio.gather(*[double(v) for v in values])
+            emit('gathered', {'sid': request.sid, 'results': results})
+            return sum(results)
+
+        class AsyncNamespace(Namespace):
+            async def on_echo(self, data):
+                loops.append(asyncio.get_running_loop())
+                return data
+
+        socketio.on_namespace(AsyncNamespace('/async'))
+        client = socketio.test_client(app, auth='secret')
+        self.assertTrue(client.is_connected())
+        self.assertFalse(socketio.test_client(app, auth='bad').is_connected())
+        self.assertEqual(client.emit('gather', list(range(10)),
+                                     callback=True), 90)
+        received = client.get_received()
+        self.assertEqual(received[0]['args'][0]['results'],
+                         [v * 2 for v in range(10)])
+        self.assertEqual(received[0]['args'][0]['sid'],
+                         socketio.server.manager.sid_from_eio_sid(
+                             client.eio_sid, '/'))
+        client.connect('/async')
+        self.assertEqual(client.emit('echo', 'foo', namespace='/async',
+                                     callback=True), 'foo')
+        self.assertEqual(len(loops), 3)
+        self.assertEqual(len(set(loops)), 1)
+        self.assertRaises(ValueError, socketio.on('foo', executor='process'),
+                          on_gather)
+
+    def test_asgi(self):
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'secret'
+        socketio = SocketIO(app, async_mode='asgi')
+        self.assertEqual(socketio.async_mode, 'asgi')
+        self.assertRaises(RuntimeError, socketio.test_client, app)
+        threads = []
+
+        @socketio.on('connect')
+        def on_connect(auth):
+            session['user'] = auth['user']
+            join_room('users')
+
+        @socketio.on('echo')
+        def on_echo(data):
+            threads.append(threading.current_thread())
+            emit('echo', {'data': data, 'user': session['user'],
+                          'scheme': request.scheme},
+                 to='users')
+            return data
+
+        class EchoNamespace(Namespace):
+            def on_echo(self, data):
+                return data
+
+        socketio.on_namespace(EchoNamespace('/ns'))
+
+        async def http(method, sid=None, body=b''):
+            query = 'EIO=4&transport=polling' + (f'&sid={sid}' if sid
+                                                 else '')
+            scope = {'type': 'http', 'method': method, 'scheme': 'https',
+                     'path': '/socket.io/', 'query_string': query.encode(),
+                     'headers': [(b'host', b'localhost'),
+                                 (b'content-length', str(len(body)).encode())],
+                     'client': ('10.0.0.1', 1234)}
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': body,
+                        'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            await socketio.asgi_app(scope, receive, send)
+            return b''.join(m.get('body', b'') for m in messages).decode()
+
+        async def session_flow():
+            sid = json.loads((await http('GET'))[1:])['sid']
+            await http('POST', sid, b'40{"user":"susan"}')
+            self.assertTrue((await http('GET', sid)).startswith('40'))
+            await http('POST', sid, b'421["echo","foo"]')
+            packets = []
+            while len(packets) < 2:
+                packets += (await http('GET', sid)).split('\x1e')
+            self.assertIn('431["foo"]', packets)
+            self.assertIn('42["echo",{"data":"foo","user":"susan",'
+                          '"scheme":"https"}]', packets)
+            await http('POST', sid, b'40/ns,')
+            self.assertTrue((await http('GET', sid)).startswith('40/ns,'))
+            await http('POST', sid, b'42/ns,2["echo","bar"]')
+            self.assertEqual(await http('GET', sid), '43/ns,2["bar"]')
+
+        asyncio.run(session_flow())
+        self.assertNotEqual(threads[0], threading.current_thread())
+
+    @unittest.skipIf(sys.platform == 'win32',
+                     'Unix sockets and fork are not available')
+    def test_unix_socket_queue(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'queue.sock')
+        hub = UnixSocketHub(path)
+        hub.bind()
+        hub_thread = threading.Thread(target=hub.serve_forever, daemon=True)
+        hub_thread.start()
+        self.addCleanup(hub_thread.join, 5)
+        self.addCleanup(hub.stop)
+        received = []
+        managers = []
+        for i in range(2):
+            manager = UnixSocketManager('unix://' + path)
+            server = python_socketio.Server(client_manager=manager,
+                                            async_mode='threading')
+            server._send_eio_packet = lambda eio_sid, pkt, i=i: \
+                received.append((i, pkt.data))
+            manager.initialize()
+            self.addCleanup(manager.thread.join, 5)
+            self.addCleanup(manager.stop)
+            manager.enter_room(manager.connect(f'eio{i}', '/'), '/', 'room')
+            managers.append(manager)
+        time.sleep(0.2)  # give the listening threads time to subscribe
+        managers[0].emit('update', {'value': 1}, namespace='/', room='room')
+        for _ in range(50):
+            if len(received) == 2:
+                break
+            time.sleep(0.05)
+        self.assertEqual(sorted(received), [(0, '2["update",{"value":1}]'),
+                                            (1, '2["update",{"value":1}]')])
+
+    @unittest.skipIf(sys.platform == 'win32',
+                     'Unix sockets and fork are not available')
+    def test_unix_hub_slow_subscriber(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'queue.sock')
+        hub = UnixSocketHub(path)
+        hub.bind()
+        hub_thread = threading.Thread(target=hub.serve_forever, daemon=True)
+        hub_thread.start()
+        self.addCleanup(hub_thread.join, 5)
+        self.addCleanup(hub.stop)
+
+        def connect(handshake):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.addCleanup(sock.close)
+            sock.connect(path)
+            sock.sendall(handshake)
+            return sock
+
+        # this subscriber never reads its messages
+        connect(b'S\x04slow')
+        subscriber = connect(b'S\x04fast')
+        time.sleep(0.1)  # give the hub time to accept the subscribers
+        frame = _encode_frame(b'x' * 65536)
+        count = 100
+        publisher = connect(b'P\x00')
+        threading.Thread(target=publisher.sendall, args=(frame * count,),
+                         daemon=True).start()
+        subscriber.settimeout(5)
+        received = 0
+        while received < len(frame) * count:
+            data = subscriber.recv(65536)
+            if not data:
+                break
+            received += len(data)
+        self.assertEqual(received, len(frame) * count)
+
+    @unittest.skipIf(sys.platform == 'win32',
+                     'Unix sockets and fork are not available')
+    def test_unix_message_queue_url(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'queue.sock')
+        url = 'unix://' + path
+
+        def wait_for_hub_exit():
+            # the hub removes its socket when it stops
+            for _ in range(50):
+                if not os.path.exists(path):
+                    break
+                time.sleep(0.05)
+
+        self.addCleanup(wait_for_hub_exit)
+        received = []
+        servers = []
+        for i in range(2):
+            socketio = SocketIO(Flask(__name__), message_queue=url,
+                                async_mode='threading')
+            manager = socketio.server.manager
+            self.assertIsInstance(manager, UnixSocketManager)
+            self.assertFalse(manager.write_only)
+            socketio.server._send_eio_packet = lambda eio_sid, pkt, i=i: \
+                received.append(i)
+            manager.initialize()
+            self.addCleanup(manager.thread.join, 5)
+            self.addCleanup(manager.stop)
+            manager.enter_room(manager.connect(f'eio{i}', '/'), '/', 'room')
+            servers.append(socketio)
+        emitter = SocketIO(message_queue=url)
+        self.addCleanup(emitter.server.manager.stop)
+        self.assertTrue(emitter.server.manager.write_only)
+        for _ in range(50):
+            # the servers subscribe in the background, one of them after
+            # starting the hub
+            emitter.emit('update', {'value': 1}, to='room')
+            time.sleep(0.1)
+            if set(received) == {0, 1}:
+                break
+        self.assertEqual(set(received), {0, 1})
+        hubs = [socketio.server.manager.hub for socketio in servers
+                if socketio.server.manager.hub is not None]
+        self.assertEqual(len(hubs), 1)
+
+    def test_batched_publishing(self):
+        class MemoryManager(python_socketio.PubSubManager):
+            def __init__(self, queue, **kwargs):
+                super().__init__(**kwargs)
+                self.queue = queue
+
+            def _publish(self, data):
+                self.queue.append(json.dumps(data))
+
+            def _listen(self):
+                yield from self.queue
+
+        queue = []
+        publisher = pubsub_class(MemoryManager)(queue, write_only=True)
+        publisher.batch_window = 0.05
+        publisher.batch_size = 3
+        python_socketio.Server(client_manager=publisher,
+                               async_mode='threading')
+        for i in range(5):
+            publisher.emit('progress', i, room='task')
+        self.assertEqual(len(queue), 1)
+        publisher.flush()
+        self.assertEqual(len(queue), 2)
+        # write-only emitters do not depend on the tasks of the async mode
+        publisher.server.start_background_task = lambda *args: None
+        publisher.emit('progress', 5, room='task')
+        self.assertEqual(len(queue), 2)
+        time.sleep(0.2)
+        self.assertEqual(len(queue), 3)
+        self.assertEqual([json.loads(m)['method'] for m in queue],
+                         ['batch', 'batch', 'emit'])
+
+        listener = pubsub_class(MemoryManager)(queue)
+        self.assertEqual([m['data'] for m in listener._listen()],
+                         [[i] for i in range(6)])
+
+        emitter = SocketIO(message_queue='unix:///tmp/unused.sock',
+                           batch_window=0.01, batch_size=10)
+        self.assertEqual(emitter.server.manager.batch_window, 0.01)
+        self.assertEqual(emitter.server.manager.batch_size, 10)
+        emitter.flush()
+
+    @unittest.skipIf(sys.platform == 'win32',
+                     'Unix sockets and fork are not available')
+    def test_queue_routing(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'queue.sock')
+        hub = UnixSocketHub(path)
+        hub.bind()
+        hub_thread = threading.Thread(target=hub.serve_forever, daemon=True)
+        hub_thread.start()
+        self.addCleanup(hub_thread.join, 5)
+        self.addCleanup(hub.stop)
+        spy = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(spy.close)
+        spy.connect(path)
+        spy.sendall(b'S\x03spy')
+        received = []
+        managers = []
+        sids = []
+        for i in range(2):
+            manager = pubsub_class(UnixSocketManager)('unix://' + path)
+            manager.routing = True
+            manager.routing_warmup = 0
+            manager.routing_delay = 1
+            server = python_socketio.Server(client_manager=manager,
+                                            async_mode='threading')
+            server._send_eio_packet = lambda eio_sid, pkt, i=i: \
+                received.append((i, pkt.data))
+            manager.initialize()
+            self.addCleanup(manager.thread.join, 5)
+            self.addCleanup(manager.stop)
+            sids.append(manager.connect(f'eio{i}', '/'))
+            manager.enter_room(sids[i], '/', f'room{i}')
+            managers.append(manager)
+        for _ in range(50):
+            if all(('/', f'room{1 - i}') in manager.node_rooms.get(
+                    managers[1 - i].host_id, ())
+                   for i, manager in enumerate(managers)):
+                break
+            time.sleep(0.05)
+
+        def read_spy():
+            spy.settimeout(0.2)
+            data = b''
+            try:
+                while True:
+                    data += spy.recv(65536)
+            except socket.timeout:
+                pass
+            return data
+
+        # a client of this server, so it is not published
+        managers[0].emit('local', 1, namespace='/', room=sids[0])
+        # hosted by the other server only
+        managers[0].emit('remote', 2, namespace='/', room='room1')
+        for _ in range(50):
+            if len(received) == 2:
+                break
+            time.sleep(0.05)
+        self.assertEqual(sorted(received), [(0, '2["local",1]'),
+                                            (1, '2["remote",2]')])
+
+        # the hub does not forward routed messages to other subscribers
+        data = read_spy()
+        self.assertIn(b'"rooms"', data)
+        self.assertNotIn(b'"emit"', data)
+
+        # a room that was not advertised yet is published to all servers
+        # (the room is added without its advertisement, as if it was still
+        # in the queue)
+        UnixSocketManager.basic_enter_room(managers[1], sids[1], '/', 'new')
+        managers[0].emit('new', 3, namespace='/', room='new')
+        for _ in range(50):
+            if len(received) == 3:
+                break
+            time.sleep(0.05)
+        self.assertEqual(received[2], (1, '2["new",3]'))
+        self.assertIn(b'"emit"', read_spy())
+
+        # rooms are advertised when they are created, without waiting for
+        # the routing delay
+        start = time.monotonic()
+        managers[1].basic_enter_room(sids[1], '/', 'room0')
+        for _ in range(50):
+            if ('/', 'room0') in managers[0].node_rooms[managers[1].host_id]:
+                break
+            time.sleep(0.01)
+        self.assertIn(('/', 'room0'),
+                      managers[0].node_rooms[managers[1].host_id])
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_queue_compression(self):
+        class MemoryManager(python_socketio.PubSubManager):
+            def __init__(self, queue, **kwargs):
+                super().__init__(**kwargs)
+                self.queue = queue
+
+            def _publish(self, data):
+                self.queue.append(self.json.dumps(data))
+
+            def _listen(self):
+                yield from self.queue
+
+        encoded = []
+
+        class CountingJSON:
+            @staticmethod
+            def dumps(obj, **kwargs):
+                encoded.append(obj)
+                return json.dumps(obj, **kwargs)
+
+            loads = staticmethod(json.loads)
+
+        queue = []
+        publisher = pubsub_class(MemoryManager)(queue, write_only=True)
+        publisher.compression = 'zlib'
+        publisher.compression_threshold = 500
+        python_socketio.Server(client_manager=publisher,
+                               async_mode='threading')
+        publisher.json = CountingJSON
+        publisher.emit('small', 'x', room='dashboard')
+        publisher.emit('large', 'x' * 1000, room='dashboard')
+        self.assertEqual([json.loads(m)['method'] for m in queue],
+                         ['emit', 'compressed'])
+        self.assertLess(len(queue[1]), 500)
+        # each message is encoded once, plus the compressed envelope
+        self.assertEqual(len(encoded), 3)
+        # emitters that do not listen cannot know if lz4 is supported
+        publisher.compression = 'lz4'
+        self.assertEqual(publisher._compression_codec(), 'zlib')
+        publisher.compression = 'zlib'
+
+        # payloads with an unknown codec header are dropped
+        queue.append(json.dumps({'method': 'compressed', 'data': 'eHl6'}))
+        listener = pubsub_class(MemoryManager)(queue)
+        self.assertEqual([(m['event'], m['data']) for m in listener._listen()],
+                         [('small', ['x']), ('large', ['x' * 1000])])
+
+        # lz4 is only used when all the servers announced that they decode it
+        del queue[:]
+        python_socketio.Server(client_manager=listener,
+                               async_mode='threading')
+        listener.compression = 'lz4'
+        listener.initialize()
+        self.assertEqual(json.loads(queue[0])['codecs'], sorted(CODECS))
+        queue[:] = [json.dumps({'method': 'codecs', 'host_id': 'a',
+                                'codecs': ['lz4', 'zlib']})]
+        list(listener._listen())
+        self.assertEqual(listener._compression_codec(), 'lz4')
+        queue[:] = [json.dumps({'method': 'codecs', 'host_id': 'b',
+                                'codecs': ['zlib'], 'sync': True})]
+        list(listener._listen())
+        self.assertEqual(listener._compression_codec(), 'zlib')
+        # the new server was sent the codecs of this one
+        self.assertEqual(json.loads(queue[-1])['method'], 'codecs')
+
+        emitter = SocketIO(message_queue='unix:///tmp/unused.sock',
+                           queue_compression='zlib',
+                           queue_compression_threshold=10)
+        self.assertEqual(emitter.server.manager.compression, 'zlib')
+        self.assertEqual(emitter.server.manager.compression_threshold, 10)
+        with self.assertRaises(ValueError):
+            SocketIO(message_queue='unix:///tmp/unused.sock',
+                     queue_compression='brotli')
+
+    def test_preserialized_emit(self):
+        snapshot = {'values': [1, 2, 3]}
+        payload = socketio.preserialize(snapshot, version=1)
+        self.assertIsInstance(payload, Preserialized)
+        self.assertIs(socketio.preserialize(snapshot, version=1), payload)
+        client = socketio.test_client(app, auth={'foo': 'bar'})
+        client.get_received()
+        socketio.emit('snapshot', (payload, 'extra'))
+        client.emit('join room', {'room': 'dashboard'})
+        socketio.emit('snapshot', payload, to='dashboard',
+                      namespace='/')
+
+        # the cached encoding is reused until the version changes
+        snapshot['values'].append(4)
+        socketio.emit('snapshot', socketio.preserialize(snapshot, version=1))
+        socketio.emit('snapshot', socketio.preserialize(snapshot, version=2))
+        received = client.get_received()
+        self.assertEqual([r['args'] for r in received], [
+            [{'values': [1, 2, 3]}, 'extra'],
+            [{'values': [1, 2, 3]}],
+            [{'values': [1, 2, 3]}],
+            [{'values': [1, 2, 3, 4]}],
+        ])
+
+        cache_size = socketio.preserialize_cache.maxsize
+        try:
+            socketio.preserialize_cache.maxsize = 1
+            socketio.preserialize(snapshot, version=3)
+            self.assertEqual(len(socketio.preserialize_cache.items), 1)
+        finally:
+            socketio.preserialize_cache.maxsize = cache_size
+
+        # other servers receive the original data through the queue
+        queue = []
+
+        class MemoryManager(python_socketio.PubSubManager):
+            def _publish(self, data):
+                queue.append(json.dumps(data))
+
+        emitter = SocketIO()
+        emitter.init_app(None, client_manager=pubsub_class(MemoryManager)(
+            write_only=True))
+        emitter.emit('snapshot', (emitter.preserialize(snapshot), 'extra'),
+                     to='room')
+        self.assertEqual(json.loads(queue[0])['data'],
+                         [{'values': [1, 2, 3, 4]}, 'extra'])
+        emitter = SocketIO()
+        emitter.init_app(None, serializer=python_socketio.packet.Packet)
+        self.assertFalse(emitter.encode_once)
+
+    @unittest.skipIf(sys.platform == 'win32',
+                     'Unix sockets and fork are not available')
+    def test_supervisor(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+
+        def worker():
+            open(os.path.join(directory, str(os.getpid())), 'w').close()
+            try:
+                # only the first worker to create this file crashes
+                os.close(os.open(os.path.join(directory, 'crashed'),
+                                 os.O_CREAT | os.O_EXCL))
+            except FileExistsError:
+                time.sleep(10)
+            else:
+                raise RuntimeError('worker crashed')
+
+        def stop_when_started():
+            for _ in range(100):
+                if len(os.listdir(directory)) == 4:
+                    break
+                time.sleep(0.05)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        supervisor = Supervisor(2, worker, restart_delay=0)
+        threading.Thread(target=stop_when_started, daemon=True).start()
+        start = time.monotonic()
+        supervisor.run()
+        self.assertLess(time.monotonic() - start, 5)
+        # two workers, plus the one that replaced the crashed worker
+        self.assertEqual(len(os.listdir(directory)), 4)
+        self.assertEqual(supervisor.children, {})
+
+    @unittest.skipIf(sys.platform == 'win32',
+                     'Unix sockets and fork are not available')
+    def test_worker_queue(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        emitter = SocketIO(message_queue='unix://' + os.path.join(
+            directory, 'queue.sock'), queue_routing=True)
+        parent_manager = emitter.server.manager
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            exit_code = 1
+            try:
+                emitter._init_worker_queue()
+                manager = emitter.server.manager
+                os.write(write_fd, f'{manager.host_id} '
+                                   f'{manager is parent_manager} '
+                                   f'{manager.routing}'.encode())
+                exit_code = 0
+            finally:
+                os._exit(exit_code)
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+        with os.fdopen(read_fd) as f:
+            host_id, same, routing = f.read().split()
+        self.assertNotEqual(host_id, parent_manager.host_id)
+        self.assertEqual((same, routing), ('False', 'True'))
+
+    def test_json_codecs(self):
+        from socketio import packet
+        from engineio import packet as eio_packet
+        saved_json = (packet.Packet.json, eio_packet.Packet.json)
+
+        class Point:
+            def __init__(self, x, y):
+                self.x = x
+                self.y = y
+
+        try:
+            app = Flask(__name__)
+            app.json.default = lambda o: {'x': o.x, 'y': o.y}
+            socketio = SocketIO(app, json=flask_json)
+            self.assertIs(socketio.server_options['json'], app.json)
+
+            @socketio.on('point')
+            def on_point(data):
+                emit('point response', {'point': Point(data, 2)})
+
+            client = socketio.test_client(app)
+            client.emit('point', 1)
+            received = client.get_received()
+            self.assertEqual(received[0]['args'][0],
+                             {'point': {'x': 1, 'y': 2}})
+
+            socketio = SocketIO(app, json='orjson')
+
+            @socketio.on('keys')
+            def on_keys(data):
+                emit('keys response', {1: data})
+
+            client = socketio.test_client(app)
+            client.emit('keys', 'one')
+            received = client.get_received()
+            self.assertEqual(received[0]['args'][0], {'1': 'one'})
+
+            self.assertRaises(ValueError, SocketIO, app, json='foo')
+        finally:
+            packet.Packet.json, eio_packet.Packet.json = saved_json
+
     def test_encode_decode(self):
         client = socketio.test_client(app, auth={'foo': 'bar'})
         client.get_received()